@@ -0,0 +1,206 @@
+"""
+Functions for generating training data from a snapshot by modifying delta and
+viscosity (see datafile.augment).
+The sample first pipeline draws the rows of each variant before modifying
+them, so that only the sampled rows are scaled and given dimensionless values.
+Off wall reference values are still computed from the full y plane of each
+variant, so the samples are the same as from the complete variants.
+Variants can be generated by several worker processes, which read the base
+snapshot from shared memory. Samples are seeded per variant, so serial and
+parallel runs give identical datasets.
+"""
+
+#import libraries
+import numpy as np
+import pandas as pd
+import datafile
+from grid import GridIndex
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+### ---------- GLOBAL VARIABLES -----------------###
+# dimensionless values added to the variants
+DIMENSIONLESS_COLUMNS = ['dim_y', 'dim_delta', 'dim_veloc']
+
+
+# function to add dimensionless values to dataset
+# grid: GridIndex of the dataframe, built if not provided. Modified versions of
+# a file share the grid index of the file.
+def get_off_wall_point(dataframe, height=1, grid=None):
+    if grid is None:
+        grid = GridIndex.from_dataframe(dataframe)
+    return grid.off_wall_point(dataframe, height=height)
+
+def add_data(data,off_wall_height=1, grid=None, off_wall_point=None):
+    """
+    Add dimensionless values of y, delta and velocity, using the height and
+    mean velocity of the y plane number off_wall_height. Provide off_wall_point
+    (height, velocity) when data is only a sample of the snapshot.
+    """
+    if off_wall_point is None:
+        off_wall_point = get_off_wall_point(data, height=off_wall_height, grid=grid)
+    off_h, off_vel = off_wall_point
+    data['dim_y'] = data["Points:1"] / off_h
+    data['dim_delta'] = data['delta']/ off_h
+    data['dim_veloc'] = data["VELOC:0"] / off_vel
+    return data
+
+
+class Variant(object):
+    """
+    Description of one block of the training data: a sample of the base file
+    modified for a new delta or a new viscosity (or unmodified if both None).
+    """
+    def __init__(self, sample_size, delta=None, viscosity=None, dimensionless=True):
+        assert delta is None or viscosity is None, "modify either delta or viscosity"
+        self.sample_size = sample_size
+        self.delta = delta
+        self.viscosity = viscosity
+        self.dimensionless = dimensionless
+
+    def __repr__(self):
+        return "Variant(sample_size=%s, delta=%s, viscosity=%s)" % (self.sample_size, self.delta, self.viscosity)
+
+    def modify(self, dataframe, delta_old, viscosity_old):
+        """
+        Return modified copy of dataframe (rows of the base file).
+        """
+        new_deltas = None if self.delta is None else [self.delta]
+        new_viscosities = None if self.viscosity is None else [self.viscosity]
+        modified = datafile.augment(dataframe, delta_old, viscosity_old, new_deltas=new_deltas,
+                                    new_viscosities=new_viscosities, inclusive=not (new_deltas or new_viscosities))
+        modified.index = dataframe.index
+        return modified
+
+    def metadata(self, source, delta_old, viscosity_old):
+        return dict(source=source,
+                    delta=delta_old if self.delta is None else self.delta,
+                    viscosity=viscosity_old if self.viscosity is None else self.viscosity,
+                    sample_size=self.sample_size)
+
+
+def sample_rows(n_rows, sample_size, seed):
+    """
+    Return sorted positions of round(sample_size * n_rows) rows drawn without
+    replacement (same number of rows as DataFrame.sample(frac=sample_size)).
+    """
+    rng = np.random.default_rng(seed)
+    n_sample = int(round(sample_size * n_rows))
+    return np.sort(rng.choice(n_rows, n_sample, replace=False))
+
+
+def variant_seeds(seed, n_variants):
+    """
+    Return one independent seed per variant, so that the rows drawn for a
+    variant do not depend on the other variants or on the order they are run.
+    """
+    return np.random.SeedSequence(seed).spawn(n_variants)
+
+
+def make_variant_sample(base_file, plane_rows, variant, rows, delta_old, viscosity_old):
+    """
+    Return sample rows of the base file modified for variant, with the
+    dimensionless values computed from the full off wall plane of the variant
+    (plane_rows: positions of the rows of the off wall plane, see GridIndex).
+    """
+    sample = variant.modify(base_file.iloc[rows], delta_old, viscosity_old)
+    if variant.dimensionless:
+        plane = variant.modify(base_file.iloc[plane_rows], delta_old, viscosity_old)
+        off_wall_point = float(plane["Points:1"].values[0]), np.mean(plane["VELOC:0"].values)
+        sample = add_data(sample, off_wall_point=off_wall_point)
+    return sample
+
+
+def share_dataframe(dataframe):
+    """
+    Copy the columns of a (numeric) dataframe into one shared memory block.
+    Returns the block and a description used by attach_dataframe. The block
+    must be closed and unlinked by the caller when no longer needed.
+    """
+    columns = []
+    offset = 0
+    for column in dataframe.columns:
+        dtype = dataframe[column].values.dtype
+        columns.append((column, dtype.str, offset))
+        # keep each column aligned on 8 bytes
+        offset += -(-len(dataframe) * dtype.itemsize // 8) * 8
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for column, dtype, column_offset in columns:
+        shared = np.ndarray(len(dataframe), dtype=dtype, buffer=block.buf, offset=column_offset)
+        shared[:] = dataframe[column].values
+    return block, dict(name=block.name, n_rows=len(dataframe), columns=columns)
+
+def attach_dataframe(description):
+    """
+    Return shared memory block and read only dataframe (no copy) of a
+    dataframe shared with share_dataframe.
+    """
+    block = shared_memory.SharedMemory(name=description["name"])
+    data = {}
+    for column, dtype, offset in description["columns"]:
+        data[column] = np.ndarray(description["n_rows"], dtype=dtype, buffer=block.buf, offset=offset)
+        data[column].flags.writeable = False
+    columns = [column for column, _, _ in description["columns"]]
+    return block, pd.DataFrame(data, columns=columns, copy=False)
+
+
+# state of worker processes: shared base file and reference values
+_worker = {}
+
+def _init_worker(description, plane_rows, delta_old, viscosity_old):
+    block, base_file = attach_dataframe(description)
+    _worker.update(block=block, base_file=base_file, plane_rows=plane_rows,
+                   delta_old=delta_old, viscosity_old=viscosity_old)
+
+def _worker_variant_sample(variant, variant_seed):
+    base_file = _worker["base_file"]
+    rows = sample_rows(len(base_file), variant.sample_size, variant_seed)
+    return make_variant_sample(base_file, _worker["plane_rows"], variant, rows,
+                               _worker["delta_old"], _worker["viscosity_old"])
+
+
+def sample_first_augmentation(base_file, variants, writer, source, seed=0, grid=None, off_wall_height=1,
+                              workers=1):
+    """
+    Generate the sample of each variant of base_file and append it to writer
+    (dataset.DatasetWriter) as soon as it is ready, so that only the samples
+    being generated are held in memory.
+    Input:
+        - base_file = dataframe of the snapshot, with viscosity column
+        - variants = list of Variant
+        - source = name of the snapshot, stored in the block metadata
+        - workers = number of processes generating variants. The base file is
+          shared with the workers through shared memory. Blocks are written in
+          the order of variants and the output does not depend on workers.
+    Returns number of rows written.
+    """
+    if grid is None:
+        grid = GridIndex.from_dataframe(base_file)
+    plane_rows = grid.plane_rows(off_wall_height)
+    delta_old = np.max(base_file['delta'].values)
+    viscosity_old = base_file['viscosity'].values[0]
+    seeds = variant_seeds(seed, len(variants))
+
+    block = None
+    if workers > 1:
+        block, description = share_dataframe(base_file)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(description, plane_rows, delta_old, viscosity_old))
+        samples = pool.map(_worker_variant_sample, variants, seeds)
+    else:
+        samples = (make_variant_sample(base_file, plane_rows, variant,
+                                       sample_rows(len(base_file), variant.sample_size, variant_seed),
+                                       delta_old, viscosity_old)
+                   for variant, variant_seed in zip(variants, seeds))
+    n_rows = 0
+    try:
+        for variant, sample in zip(variants, samples):
+            writer.append(sample, **variant.metadata(source, delta_old, viscosity_old))
+            n_rows += len(sample)
+            print("%s\t:\t%d rows" %(variant, len(sample)))
+    finally:
+        if block is not None:
+            pool.shutdown()
+            block.close()
+            block.unlink()
+    return n_rows
@@ -0,0 +1,89 @@
+"""
+script to benchmark the training engines of XGBoost_Model: exact tree method
+on DMatrix input (previous default) against the hist engine on QuantileDMatrix
+input. Reports time to build the input, training time and the time needed to
+reach the same validation RMSE.
+usage: python bench_engine.py [number_of_rows | training data] [rounds] [max_bin] [nthread]
+"""
+
+import pandas as pd
+import numpy as np
+import xgboost as xgb
+import clean_dataframe as cd
+from bench_features import make_snapshot
+from dataset import read_training_data
+from dmatrix_cache import DMatrixCache
+from functions import XGBoost_Model
+import sys, os, time
+
+params = dict(max_depth=7,
+              learning_rate=0.1,
+              subsample=0.9,
+              colsample_bytree=0.9,
+              objective="reg:squarederror")
+
+
+class RoundTimer(xgb.callback.TrainingCallback):
+    """
+    Record elapsed time after each boosting round.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.times = []
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.times.append(time.perf_counter() - self.start)
+        return False
+
+
+def load_data(source):
+    if os.path.exists(source):
+        return cd.clean_dataframe(read_training_data(source, columns=cd.input_columns()))
+    data = make_snapshot(int(float(source)))
+    # response depending on the features, so that RMSE decreases with training
+    data['u_plus'] = data['VELOC:0'] / np.sqrt(np.abs(data['wall_shear'])) * 1e-2 + \
+        np.random.RandomState(1).normal(0, 0.5, len(data))
+    with np.errstate(all="ignore"):
+        return cd.clean_dataframe(data)
+
+
+def run_engine(data, engine, rounds, max_bin, nthread):
+    start = time.perf_counter()
+    model = XGBoost_Model(dict(params), data, dmatrix_cache=DMatrixCache(cache_dir=None),
+                          engine=engine, max_bin=max_bin, nthread=nthread)
+    build_time = time.perf_counter() - start
+    timer = RoundTimer()
+    evals_result = {}
+    xgb.train(dict(params, **model.engine_params()), model.dtrain, num_boost_round=rounds,
+              evals=[(model.dvalidation, "validation")], evals_result=evals_result,
+              verbose_eval=False, callbacks=[timer])
+    return build_time, np.array(timer.times), np.array(evals_result["validation"]["rmse"])
+
+
+def time_to_rmse(times, rmse, target):
+    reached = np.nonzero(rmse <= target)[0]
+    return times[reached[0]] if len(reached) else np.nan
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "1000000"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    max_bin = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+    nthread = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count()
+    data = load_data(source)
+    print("Rows\t\t:\t%d" %len(data))
+    print("Rounds\t\t:\t%d" %rounds)
+    print("Threads\t\t:\t%d\n" %nthread)
+
+    results = {}
+    for engine in ["exact", "hist"]:
+        results[engine] = run_engine(data, engine, rounds, max_bin, nthread)
+    # RMSE reached by both engines
+    target = max(rmse[-1] for _, _, rmse in results.values())
+    print("target validation RMSE\t:\t%.5f\n" %target)
+    for engine, (build_time, times, rmse) in results.items():
+        print(engine + (" (max_bin=%d)" %max_bin if engine == "hist" else ""))
+        print("\tinput build\t:\t%.3f s" %build_time)
+        print("\ttraining\t:\t%.3f s" %times[-1])
+        print("\tfinal RMSE\t:\t%.5f" %rmse[-1])
+        print("\ttime to target\t:\t%.3f s" %time_to_rmse(times, rmse, target))
@@ -0,0 +1,73 @@
+"""
+script to benchmark the feature derivation in clean_dataframe against the
+previous implementation (all variables computed in place, logs through
+Series.apply).
+usage: python bench_features.py [number_of_rows]
+"""
+
+import pandas as pd
+import numpy as np
+import clean_dataframe as cd
+import sys, time
+
+
+def legacy_clean_dataframe(data, min_vars=True):
+    """
+    clean_dataframe before the feature registry, kept for comparison.
+    """
+    if "viscosity" not in data.columns:
+        data['viscosity'] = cd.FLOW_VISCOSITY
+    data['delta_squared'] = data['delta']**2
+    data['Local_Re'] = data['VELOC:0'] * data['delta'] / data.viscosity
+    data['Local_u_tau'] = np.sqrt(abs(data.wall_shear))
+    data['Local_u_plus'] = data['VELOC:0'] / data['Local_u_tau']
+    data['Local_Re_Avg'] = data['AVVEL:0'] * data['delta'] / data.viscosity
+    data['Local_Re_y'] = data['VELOC:0'] * data['Points:1'] / data.viscosity
+    data['Local_Re_log'] = data.Local_Re.apply(cd.calc_log)
+    data['Log_delta'] = data.delta.apply(cd.calc_log)
+    data['y_delta'] = data['Points:1'] / data.delta
+    if min_vars:
+        data = data[cd.REQUIRED_COLUMNS]
+    return data
+
+
+def make_snapshot(n_rows, seed=0):
+    rng = np.random.RandomState(seed)
+    y = rng.uniform(0, 2, n_rows)
+    return pd.DataFrame({
+        'VELOC:0' : rng.normal(1, 0.3, n_rows),
+        'AVVEL:0' : rng.normal(1, 0.1, n_rows),
+        'Points:1' : y,
+        'delta' : np.minimum(y, 2 - y),
+        'wall_shear' : rng.normal(2e-3, 1e-3, n_rows),
+        'u_plus' : rng.normal(15, 5, n_rows),
+        'y_plus' : rng.uniform(0, 1000, n_rows),
+    })
+
+
+def time_function(function, data, repeat):
+    times = []
+    for _ in range(repeat):
+        frame = data.copy()
+        start = time.perf_counter()
+        result = function(frame)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+if __name__ == "__main__":
+    n_rows = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10000000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    data = make_snapshot(n_rows)
+    print("Rows\t\t:\t%d" %n_rows)
+    with np.errstate(all="ignore"):
+        for min_vars in [True, False]:
+            legacy_time, legacy = time_function(lambda frame: legacy_clean_dataframe(frame, min_vars), data, repeat)
+            new_time, new = time_function(lambda frame: cd.clean_dataframe(frame, min_vars), data, repeat)
+            # previous path returns integer logs when all values are clipped to 0
+            identical = legacy.astype(float).equals(new.astype(float))
+            print("min_vars=%s" %min_vars)
+            print("\tprevious\t:\t%.3f s" %legacy_time)
+            print("\tregistry\t:\t%.3f s" %new_time)
+            print("\tspeedup\t\t:\t%.1fx" %(legacy_time / new_time))
+            print("\tidentical\t:\t%s" %identical)
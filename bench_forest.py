@@ -0,0 +1,48 @@
+"""
+script to benchmark the compiled forest evaluator (forest.py) against native
+xgboost predict (including the DMatrix construction) on 1k, 100k and 10M rows.
+The model is trained on a synthetic snapshot; the rows to predict are drawn
+from its clean features. Reports prediction time, rows per second and the
+largest difference between both predictions.
+usage: python bench_forest.py [rows to predict, comma separated] [rounds] [max_depth]
+"""
+
+import numpy as np
+import xgboost as xgb
+import clean_dataframe as cd
+from bench_features import make_snapshot
+from forest import compile_booster, load_forest
+import sys, time
+
+n_rows = [int(float(rows)) for rows in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1000, 100000, 10000000]
+rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+max_depth = int(sys.argv[3]) if len(sys.argv) > 3 else 7
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+with np.errstate(all="ignore"):
+    data = cd.clean_dataframe(make_snapshot(100000))
+x, y = cd.X_Y_split(data)
+booster = xgb.train(dict(max_depth=max_depth, learning_rate=0.1, objective="reg:squarederror"),
+                    xgb.DMatrix(x, y), num_boost_round=rounds)
+
+start = time.perf_counter()
+forest = compile_booster(booster)
+compile_time = time.perf_counter() - start
+forest.save("bench_forest.npz")
+load_time, _ = timed(load_forest, "bench_forest.npz")
+print("%s compiled in %.3f s, loaded in %.4f s" %(forest, compile_time, load_time))
+
+print("%10s\t%12s\t%12s\t%8s\t%10s" %("rows", "native (s)", "compiled (s)", "speedup", "max diff"))
+features = x.values.astype(np.float32)
+for rows in n_rows:
+    test_x = features[np.random.RandomState(0).randint(0, len(features), rows)]
+    native_time, native = timed(lambda: booster.predict(xgb.DMatrix(test_x, feature_names=list(x.columns))))
+    compiled_time, compiled = timed(forest.predict, test_x)
+    print("%10d\t%12.4f\t%12.4f\t%8.2f\t%10.2e" %(rows, native_time, compiled_time, native_time / compiled_time,
+          np.abs(native - compiled).max()))
@@ -0,0 +1,82 @@
+"""
+script to benchmark the inference server (inference_server.py) against loading
+the joblib model and predicting for each request. Concurrent clients send
+small requests of raw snapshot rows; the server is run without waiting
+(max_delay 0: only requests already queued are batched) and with micro
+batches. Reports throughput and latency percentiles measured by the clients.
+usage: python bench_inference.py [clients] [requests per client] [rows per request] [max_delay (ms)]
+"""
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import joblib
+import clean_dataframe as cd
+from bench_features import make_snapshot
+from inference_server import InferenceServer, InferenceClient, predict
+from concurrent.futures import ThreadPoolExecutor
+import sys, os, time, asyncio, threading, tempfile
+
+clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+n_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+rows = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+max_delay = float(sys.argv[4]) / 1000 if len(sys.argv) > 4 else 0.002
+
+
+def report(name, latencies, elapsed):
+    latencies = np.asarray(latencies) * 1000
+    print("%-22s\t%10.0f\t%8.2f\t%8.2f\t%8.2f" %(name, len(latencies) / elapsed, np.percentile(latencies, 50),
+          np.percentile(latencies, 90), np.percentile(latencies, 99)))
+
+
+def run_clients(request):
+    """
+    Run request(client index) n_requests times in each client thread, return
+    latencies and elapsed time.
+    """
+    def client(index):
+        latencies = []
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            request(index)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        latencies = sum(executor.map(client, range(clients)), [])
+    return latencies, time.perf_counter() - start
+
+
+def serve(server, started):
+    async def main():
+        await server.start()
+        started.set()
+        await asyncio.Event().wait()
+    asyncio.run(main())
+
+
+with np.errstate(all="ignore"):
+    data = cd.clean_dataframe(make_snapshot(100000))
+x, y = cd.X_Y_split(data)
+model = xgb.XGBRegressor(n_estimators=50, max_depth=7).fit(x, y)
+folder = tempfile.mkdtemp()
+joblib.dump(model, folder + "/model.mdl")
+raw = make_snapshot(rows * clients, seed=1)
+raw = raw[[column for column in cd.input_columns(list(x.columns)) if column in raw.columns]]
+requests = [raw.iloc[index * rows:(index + 1) * rows].reset_index(drop=True) for index in range(clients)]
+
+print("%d clients, %d requests of %d rows each" %(clients, n_requests, rows))
+print("%-22s\t%10s\t%8s\t%8s\t%8s" %("", "requests/s", "p50 (ms)", "p90 (ms)", "p99 (ms)"))
+report("load and predict", *run_clients(lambda index: predict(joblib.load(folder + "/model.mdl"), requests[index])))
+
+for name, delay in [("server, no delay", 0.0), ("server, %g ms batches" %(max_delay * 1000), max_delay)]:
+    address = folder + "/%s.sock" %delay
+    server = InferenceServer(dict(model=model), address, max_delay=delay)
+    server.warm_up()
+    started = threading.Event()
+    threading.Thread(target=serve, args=(server, started), daemon=True).start()
+    started.wait()
+    connections = [InferenceClient(address) for _ in range(clients)]
+    report(name, *run_clients(lambda index: connections[index].predict(requests[index])))
+    stats = server.stats.report()
+    print("%22s\t%d batches, %.1f requests per batch" %("", stats["batches"], stats["mean_batch_requests"]))
@@ -0,0 +1,123 @@
+"""
+Checkpoints of xgboost training runs.
+The booster and the evaluation history are saved in a run directory every
+few rounds, so that a killed run can be resumed from its latest checkpoint.
+The history of the resumed run is the complete history since the first round,
+and early stopping is decided on it, so a resumed run ends as the same run
+without interruption. xgboost does not save the state of its random
+sampling, so rounds after a resume are identical only for deterministic
+training (subsample and colsample_* of 1).
+"""
+
+#import libraries
+import os, json
+import numpy as np
+import xgboost as xgb
+
+### ---------- GLOBAL VARIABLES -----------------###
+BOOSTER_FILE = "booster.json"
+STATE_FILE = "checkpoint.json"
+# metrics where larger is better (as xgboost early stopping)
+MAXIMIZE_METRICS = ["auc", "aucpr", "map", "ndcg", "pre"]
+
+
+class Checkpoint(xgb.callback.TrainingCallback):
+    """
+    Callback saving the booster and evaluation history to run_dir every
+    period rounds and at the end of training (dtrain: training data of the
+    run, checked when resuming).
+    With early_stopping_rounds, training stops when the last metric of the
+    last evaluation set did not improve for that many rounds (as the
+    early_stopping_rounds of xgb.train, which cannot be resumed).
+    """
+    def __init__(self, run_dir, dtrain, period=10, early_stopping_rounds=None):
+        super(Checkpoint, self).__init__()
+        self.run_dir = run_dir
+        self.data_shape = [dtrain.num_row(), dtrain.num_col()]
+        self.period = period
+        self.early_stopping_rounds = early_stopping_rounds
+        # history of the rounds of previous runs
+        self.previous = {}
+        self.history = {}
+        self.stopped = False
+        if not os.path.isdir(run_dir):
+            os.makedirs(run_dir)
+
+    def path(self, filename):
+        return os.path.join(self.run_dir, filename)
+
+    def exists(self):
+        return os.path.isfile(self.path(STATE_FILE))
+
+    def load(self):
+        """
+        Return booster of the latest checkpoint, restoring its history.
+        """
+        with open(self.path(STATE_FILE)) as state_file:
+            state = json.load(state_file)
+        assert state["data_shape"] == self.data_shape, "checkpoint was trained on other data"
+        booster = xgb.Booster(model_file=self.path(BOOSTER_FILE))
+        assert booster.num_boosted_rounds() == state["rounds"], "booster and checkpoint state do not match"
+        self.previous = state["history"]
+        self.history = state["history"]
+        self.stopped = state["stopped"]
+        print("Resuming from checkpoint at round %d" %state["rounds"])
+        return booster
+
+    @property
+    def rounds(self):
+        """
+        Number of rounds in the history.
+        """
+        for metrics in self.history.values():
+            for values in metrics.values():
+                return len(values)
+        return 0
+
+    def merge(self, evals_log):
+        self.history = {name: {metric: list(self.previous.get(name, {}).get(metric, [])) + list(values)
+                               for metric, values in metrics.items()}
+                        for name, metrics in evals_log.items()}
+
+    def best_iteration(self):
+        """
+        Return (best iteration, best score) of the last metric of the last
+        evaluation set.
+        """
+        metric = list(self.history[list(self.history)[-1]].items())[-1]
+        name, values = metric
+        values = np.asarray(values)
+        if name.split("@")[0] in MAXIMIZE_METRICS:
+            values = -values
+        # first best value, as xgboost early stopping
+        best = int(np.argmin(values))
+        return best, metric[1][best]
+
+    def save(self, model):
+        """
+        Write booster then state, both atomically, so that the state always
+        matches the saved booster.
+        """
+        model.save_model(self.path(BOOSTER_FILE + ".tmp.json"))
+        os.replace(self.path(BOOSTER_FILE + ".tmp.json"), self.path(BOOSTER_FILE))
+        state = dict(rounds=model.num_boosted_rounds(), history=self.history, stopped=self.stopped,
+                     data_shape=self.data_shape)
+        with open(self.path(STATE_FILE + ".tmp"), "w") as state_file:
+            json.dump(state, state_file)
+        os.replace(self.path(STATE_FILE + ".tmp"), self.path(STATE_FILE))
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.merge(evals_log)
+        if self.early_stopping_rounds and self.history:
+            best, _ = self.best_iteration()
+            self.stopped = self.rounds - 1 - best >= self.early_stopping_rounds
+        if self.stopped or (epoch + 1) % self.period == 0:
+            self.save(model)
+        return self.stopped
+
+    def after_training(self, model):
+        if self.early_stopping_rounds and self.history:
+            best, score = self.best_iteration()
+            model.set_attr(best_iteration=str(best), best_score=str(score))
+        self.save(model)
+        return model
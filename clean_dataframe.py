@@ -5,6 +5,7 @@ Functions for preparing dataframe for models
 #import libraries
 import pandas as pd
 import numpy as np
+from snapshot_cache import iter_snapshot
 
 ### ---------- GLOBAL VARIABLES -----------------###
 # choose which variables to include in final dataset
@@ -34,6 +35,7 @@ FLOW_VISCOSITY = visco_1000
 
 #For tests
 REQUIRED_COLUMNS = ['u_plus','y_plus','delta','Points:1','AVVEL:0','VELOC:0','Local_Re','Local_u_tau','Local_Re_log']
+
 # function to correct 0's when calculating logs
 """
 def calc_log(x):
@@ -50,32 +52,127 @@ def calc_log(x):
     else:
         return result
 
+def calc_log_array(x):
+    """
+    Vectorized version of calc_log for numpy arrays.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.log(x)
+    return np.where(result < 0, 0.0, result)
+
+
+# Registry of variables derived in clean_dataframe.
+# name : (input columns, vectorized function of the input arrays)
+# Inputs may themselves be derived variables. Only the variables needed for the
+# requested columns are computed.
+FEATURES = {
+    'delta_squared' : (['delta'], lambda delta: delta**2),
+    'Local_Re'      : (['VELOC:0','delta','viscosity'], lambda u, delta, nu: u * delta / nu),
+    'Local_u_tau'   : (['wall_shear'], lambda wall_shear: np.sqrt(np.abs(wall_shear))),
+    'Local_u_plus'  : (['VELOC:0','Local_u_tau'], lambda u, u_tau: u / u_tau),
+    'Local_Re_Avg'  : (['AVVEL:0','delta','viscosity'], lambda u_avg, delta, nu: u_avg * delta / nu),
+    'Local_Re_y'    : (['VELOC:0','Points:1','viscosity'], lambda u, y, nu: u * y / nu),
+    'Local_Re_log'  : (['Local_Re'], calc_log_array),
+    'Log_delta'     : (['delta'], calc_log_array),
+    'y_delta'       : (['Points:1','delta'], lambda y, delta: y / delta),
+}
+DERIVED_COLUMNS = list(FEATURES)
+
+def input_columns(columns=None):
+    """
+    Return the raw snapshot columns needed by clean_dataframe to produce columns
+    (REQUIRED_COLUMNS by default). Used to read only these columns from snapshots.
+    """
+    if columns is None:
+        columns = REQUIRED_COLUMNS
+    raw = []
+    def visit(name):
+        if name in FEATURES:
+            for input_name in FEATURES[name][0]:
+                visit(input_name)
+        elif name not in raw:
+            raw.append(name)
+    for name in columns:
+        visit(name)
+    return raw
+
+def compute_features(data, columns):
+    """
+    Return new dataframe holding columns of data, deriving the variables in
+    FEATURES from their inputs when required. Only the variables needed for
+    columns are computed and data is not modified.
+    Viscosity is set to FLOW_VISCOSITY if not present in data.
+    """
+    values = {}
+    def resolve(name):
+        if name in values:
+            return values[name]
+        if name in FEATURES:
+            inputs, function = FEATURES[name]
+            values[name] = function(*[resolve(input_name) for input_name in inputs])
+        elif name in data.columns:
+            values[name] = data[name].values
+        elif name == "viscosity":
+            values[name] = FLOW_VISCOSITY
+        else:
+            raise KeyError("%s not found in dataframe" % name)
+        return values[name]
+
+    output = {}
+    for name in columns:
+        output[name] = np.broadcast_to(resolve(name), (len(data),))
+    return pd.DataFrame(output, columns=list(columns), index=data.index)
+
 
 # Function to prepare dataframe and return clean dataframe ready for model
 def clean_dataframe(data, min_vars = True):
-    if "viscosity" not in data.columns:
-        data['viscosity'] = FLOW_VISCOSITY
-    assert "viscosity" in data.columns, "viscosity not found in dataframe"
-    data['delta_squared'] = data['delta']**2
-    #data['delta'] = data.delta + 0.001
-    data['Local_Re'] = data['VELOC:0'] * data['delta'] / data.viscosity
-    data['Local_u_tau'] = np.sqrt(abs(data.wall_shear))
-    data['Local_u_plus'] = data['VELOC:0'] / data['Local_u_tau'] 
-    #data['Local_Re'] = data.Local_Re + 0.001
-    data['Local_Re_Avg'] = data['AVVEL:0'] * data['delta'] / data.viscosity
-    data['Local_Re_y'] = data['VELOC:0'] * data['Points:1'] / data.viscosity
-    data['Local_Re_log'] = data.Local_Re.apply(calc_log)
-    data['Log_delta'] = data.delta.apply(calc_log)
-    data['y_delta'] = data['Points:1'] / data.delta
-    #data['pu_tau'] = np.sqrt(abs(data.wall_shear))
+    """
+    Return clean dataframe with derived variables. With min_vars only
+    REQUIRED_COLUMNS are returned (and computed), otherwise all columns of data
+    and all derived variables. data is not modified.
+    """
+    if min_vars:
+        columns = REQUIRED_COLUMNS
+    else:
+        columns = list(data.columns)
+        if "viscosity" not in columns:
+            columns.append("viscosity")
+        columns += [name for name in DERIVED_COLUMNS if name not in columns]
+    data = compute_features(data, columns)
     if min_vars:
-        data = data[REQUIRED_COLUMNS]
         msg = "Error in subsetting required columns"
         assert list(data.columns)== REQUIRED_COLUMNS, msg
     # just to drop delta. can be changed
     #data = data.drop(columns=['delta'])
     return data
 
+# Streaming versions of clean_dataframe for snapshots larger than memory
+def iter_clean_dataframe(source, chunksize=1000000, min_vars=True):
+    """
+    Clean a snapshot chunk by chunk, yielding clean dataframes.
+    Input:
+        - source = path to snapshot csv file or iterator of raw dataframe chunks
+        - chunksize = number of rows per chunk when source is a path
+    Peak memory is bounded by the chunk size. Concatenating the chunks gives
+    the same dataframe as clean_dataframe on the whole snapshot.
+    """
+    if isinstance(source, str):
+        columns = input_columns() if min_vars else None
+        source = iter_snapshot(source, chunksize=chunksize, columns=columns)
+    for chunk in source:
+        yield clean_dataframe(chunk, min_vars=min_vars)
+
+def write_clean_dataframe(source, output_path, chunksize=1000000, min_vars=True):
+    """
+    Clean a snapshot chunk by chunk and write the result to output_path (csv).
+    Returns number of rows written.
+    """
+    n_rows = 0
+    for chunk in iter_clean_dataframe(source, chunksize=chunksize, min_vars=min_vars):
+        chunk.to_csv(output_path, mode="a" if n_rows else "w", header=not n_rows, index=False)
+        n_rows += len(chunk)
+    return n_rows
+
 # Function to get inputs and response from clean-dataframe
 # drop delta if not required as input
 def X_Y_split(dataframe):
@@ -4,15 +4,19 @@ sys.path.insert(0,"/Users/Lawrence/Documents/MACHINE_LEARNING/INTERNSHIP/Turbu/S
 
 import pandas as pd
 import numpy as np
-from clean_dataframe import clean_dataframe, X_Y_split
+from clean_dataframe import clean_dataframe, X_Y_split, input_columns
+from dataset import read_training_data
 from sklearn.model_selection import train_test_split
 import xgboost as xgb
 import matplotlib.pyplot as plt
 from sklearn.externals import joblib
-from sklearn.model_selection import RandomizedSearchCV
+from tuning import CVFolds, cv_search
+from trial_store import TrialStore, TRIALS_FILE
+from functions import estimator_params
 import warnings
 warnings.filterwarnings('ignore',category=FutureWarning)
 from visualize_results import display_results
+from registry import save_model
 
 #** DEFINE STORAGE LOCATIONS
 WORKING_FOLDER = os.getcwd()
@@ -41,9 +45,9 @@ except FileNotFoundError:
     sys.exit(1)
 
 # read file into dataframe
-raw_file = pd.read_csv(train_file)
+raw_file = read_training_data(train_file, columns=input_columns())
 
-raw_file = raw_file.sample(frac=0.01)
+raw_file = raw_file.sample(frac=0.01, random_state=0)
 
 # *************** PREPARE DATAFRAME ********************************
 print("Preparing dataframe...")
@@ -55,7 +59,7 @@ clean_file = clean_dataframe(raw_file)
 train_data, validation_data = train_test_split(clean_file, test_size=0.3, random_state=10)
 
 # get mini sample to used for tuning
-mini_train_data = train_data.sample(frac=0.1)
+mini_train_data = train_data.sample(frac=0.1, random_state=0)
 
 # split data into input and response
 train_x, train_y = X_Y_split(train_data)
@@ -100,7 +104,7 @@ initial_model = initial_model.fit(full_x, full_y,)
 
 # save model
 print("saving model...\n")
-joblib.dump(initial_model, f"{MODEL_FOLDER}/initial_model")
+save_model(initial_model, f"{MODEL_FOLDER}/initial_model", source=train_file)
 
 print(f"model saved at {MODEL_FOLDER}!")
 
@@ -118,11 +122,14 @@ parameters = {
     'gamma' : np.linspace(0,40, num = 5),
 }
 
-# set up randomizedsearch for good parameters with tuning
+# randomized search of 100 candidates on 5 folds of the mini sample. Each
+# candidate is written to the trial store when evaluated, so that an
+# interrupted search resumes with the candidates not yet evaluated
 print("starting model tuning...")
-tuned_model = RandomizedSearchCV(initial_model,parameters,n_iter=100, n_jobs=1,
-                        scoring="neg_mean_squared_error", cv=5)
-tuned_model.fit(mini_train_x, mini_train_y, verbose=False)
+folds = CVFolds(mini_train_data, n_splits=5)
+store = TrialStore(f"{WORKING_FOLDER}/{TRIALS_FILE}")
+tuned_model = cv_search(folds, parameters, base_params=estimator_params(initial_model), n_candidates=100,
+                        store=store)
 
 # write grid results to file
 print("Model Tuning completed, writing grid results to file...\n")
@@ -132,12 +139,12 @@ grid_results.to_csv(f"{TRAIN_FOLDER}/tuning_grid_results.csv", header=True, inde
 
 # evaluate tuned model
 print("Fitting tuned model to train data and evaluating with validation data")
-final_estimator = tuned_model.best_estimator_
+final_estimator = xgb.XGBRegressor(**dict(initial_model.get_params(), **tuned_model.best_params_))
 final_model = final_estimator.fit(train_x, train_y, eval_set=eval_set, eval_metric="rmse",early_stopping_rounds=50, verbose=False)
 
 # save tuned model
 print("saving tuned  model...\n")
-joblib.dump(tuned_model, f"{MODEL_FOLDER}/tuned_model")
+save_model(final_model, f"{MODEL_FOLDER}/tuned_model", source=train_file)
 
 print(f"model saved at {MODEL_FOLDER}!")
 
@@ -147,5 +154,5 @@ final_model = final_model.fit(full_x, full_y,)
 
 # save model
 print("saving final model...")
-joblib.dump(final_model, f"{MODEL_FOLDER}/final_model")
+save_model(final_model, f"{MODEL_FOLDER}/final_model", source=train_file)
 
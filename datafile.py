@@ -4,7 +4,10 @@ function for working with dataframe and making modifications
 # libraries
 import pandas as pd
 import numpy as np
+import glob
 #import clean_dataframe as cd
+from snapshot_cache import read_snapshot
+from grid import GridIndex, DenseFields, COORDINATES
 
 
 import warnings
@@ -16,6 +19,9 @@ warnings.filterwarnings("ignore")
 deltas = [1e-3,0.1, 100, 1e3]
 viscos = [1e-4,0.1, 100, 1e5]
 
+# columns scaled when delta or viscosity is modified
+VELOCITY_COLUMNS = ['VELOC:0','VELOC:1','VELOC:2','AVVEL:0','AVVEL:1','AVVEL:2']
+
 class DataFile(object):
     """
     Class for a datafile giving allowing to perform additional functions directly.
@@ -28,16 +34,16 @@ class DataFile(object):
         if not(dataframe is None):
             self.dataframe = dataframe
         elif file_path != None:
-            self.dataframe = pd.read_csv(file_path)
+            self.dataframe = read_snapshot(file_path)
         # fill viscosity column in dataframe
         if "viscosity" in self.dataframe.columns:
             if viscosity != None:
                 msg = "Viscosity provided different from viscosity value in datafile provided!"
-                assert dataframe.viscosity[0] == viscosity, msg
+                assert self.dataframe.viscosity[0] == viscosity, msg
             else:
                 # check that one unique value of viscosity present for all dataset
-                assert len(np.unique(dataframe.viscosity)) == 1, "more than 1 value of viscosity found."
-            self.Viscosity = self.dataframe.viscosity
+                assert len(np.unique(self.dataframe.viscosity)) == 1, "more than 1 value of viscosity found."
+            self.Viscosity = self.dataframe.viscosity.iloc[0]
         else:
             assert viscosity != None, "viscosity value required for datafile"
             self.Viscosity = viscosity
@@ -45,7 +51,13 @@ class DataFile(object):
         
         # fill height of channel
         assert "delta" in self.dataframe.columns, "delta value missing"
-        self.delta = np.max(dataframe.delta)
+        self.delta = np.max(self.dataframe.delta)
+
+        # index of structured grid, shared by all modified versions of the datafile
+        if all(coordinate in self.dataframe.columns for coordinate in COORDINATES):
+            self.grid = GridIndex.from_dataframe(self.dataframe)
+        else:
+            self.grid = None
             
     def __call__(self):
         return self.dataframe
@@ -76,6 +88,31 @@ class DataFile(object):
         else:
             return temp_df
     
+    def off_wall_point(self, dataframe=None, height=1):
+        """
+        Return height and mean velocity of y plane number height, of the
+        datafile or of a modified version of it (dataframe).
+        """
+        assert self.grid is not None, "grid coordinates missing in datafile"
+        if dataframe is None:
+            dataframe = self.dataframe
+        return self.grid.off_wall_point(dataframe, height=height)
+
+    def to_dense(self, columns=None):
+        """
+        Return dense (ny, nx, nz) arrays of columns of the datafile (DenseFields).
+        """
+        assert self.grid is not None, "grid coordinates missing in datafile"
+        return DenseFields.from_dataframe(self.dataframe, columns=columns, grid=self.grid)
+
+    def augment(self, new_deltas=None, new_viscosities=None, inclusive=False):
+        """
+        Return all variants of dataset for the new deltas and viscosities in one
+        dataframe. See augment function.
+        """
+        return augment(self.dataframe, self.delta, self.Viscosity, new_deltas=new_deltas,
+                       new_viscosities=new_viscosities, inclusive=inclusive)
+
     def get_modified_sample(self, sample_size=10000, new_delta=None, new_viscosity=None, keep_original=False, inclusive=True):
         modified_sample = return_modified_sample(self, sample_size=sample_size, new_delta=new_delta,
                                                  new_viscosity=new_viscosity,keep_original=keep_original, inclusive=inclusive)
@@ -90,15 +127,8 @@ def modify_viscosity(dataframe_main, viscosity_old, viscosity_new):
     Given a new viscosity value, replace old viscosity with this value in a dataframe.
     Scale velocity and u_tau accordingly using helper functions.
     """
-    dataframe = dataframe_main.copy()
-    dataframe['viscosity'] = viscosity_old
-    ratio = viscosity_new / viscosity_old
-    scale_velocity(dataframe, ratio, inplace=True)
-    scale_utau(dataframe, ratio, inplace=True)
-    #dataframe['u_tau'] = dataframe['u_tau'] * ratio
-    dataframe['viscosity'] = viscosity_new
-    dataframe['u_plus'] = dataframe['VELOC:0'] /  dataframe['u_tau']
-    dataframe['y_plus'] = dataframe['delta'] * dataframe['u_tau'] / dataframe['viscosity']
+    dataframe = augment(dataframe_main, None, viscosity_old, new_viscosities=[viscosity_new])
+    dataframe.index = dataframe_main.index
     return dataframe
 
 # function to rescale velocities
@@ -131,24 +161,109 @@ def new_y(old_y,delta_new):
     else:
         return old_y
 
+def mirror_y(old_y, delta_new):
+    """
+    Vectorized version of new_y for arrays of y values.
+    """
+    return np.where(old_y > delta_new, 2*delta_new - old_y, old_y)
+
 def modify_delta(dataframe_main, delta_old, delta_new):
     """
     Given a new delta (half channel) value, replace old delta with this value in a dataframe.
     Scale velocity and u_tau accordingly using helper functions.
     Recalculate new delta.
     """
-    dataframe = dataframe_main.copy()
-    ratio = delta_old / delta_new
-    #dataframe['viscosity'] = viscosity_original
-    scale_velocity(dataframe, ratio, inplace=True)
-    dataframe['Points:1'] = dataframe['Points:1'] * (delta_new/delta_old)
-    scale_utau(dataframe, ratio, inplace=True)
-    dataframe['u_plus'] = dataframe['VELOC:0'] / dataframe['u_tau']
-    dataframe['delta'] = dataframe['Points:1'].apply(new_y, args=(delta_new,))
-    dataframe['y_plus'] = dataframe['delta'] * dataframe['u_tau'] / dataframe['viscosity']
+    dataframe = augment(dataframe_main, delta_old, None, new_deltas=[delta_new])
+    dataframe.index = dataframe_main.index
     return dataframe
 
 
+def augment(dataframe, delta_old, viscosity_old, new_deltas=None, new_viscosities=None, inclusive=False):
+    """
+    Given lists of new deltas and viscosities, return all modified versions of
+    dataframe stacked in a single dataframe, in the order:
+        original (if inclusive), new_deltas, new_viscosities
+    Rows of variant k are rows k*len(dataframe) to (k+1)*len(dataframe) (see
+    split_variants). Values are the same as from modify_delta and
+    modify_viscosity.
+    All variants are computed in one vectorized pass into one preallocated
+    array; only the columns changed by the modifications are computed, the
+    other columns are repeated.
+    """
+    new_deltas = np.asarray([] if new_deltas is None else new_deltas, dtype=float)
+    new_viscosities = np.asarray([] if new_viscosities is None else new_viscosities, dtype=float)
+    n_rows = len(dataframe)
+    n_base = 1 if inclusive else 0
+    n_modified = len(new_deltas) + len(new_viscosities)
+    n_variants = n_base + n_modified
+    is_delta = np.arange(n_modified) < len(new_deltas)
+
+    columns = list(dataframe.columns)
+    if "viscosity" not in columns:
+        assert viscosity_old is not None, "viscosity value required for dataframe"
+        columns.append("viscosity")
+    changed = [col for col in VELOCITY_COLUMNS if col in columns]
+    changed += ['u_tau', 'u_plus', 'y_plus', 'viscosity']
+    if len(new_deltas):
+        changed += ['Points:1', 'delta']
+    float_columns = [col for col in columns if col in changed or dataframe[col].dtype == np.float64]
+    other_columns = [col for col in columns if col not in float_columns]
+
+    # per variant scaling of velocities and wall distances
+    velocity_ratio = np.empty(n_modified)
+    y_ratio = np.ones(n_modified)
+    if len(new_deltas):
+        velocity_ratio[is_delta] = delta_old / new_deltas
+        y_ratio[is_delta] = new_deltas / delta_old
+    if len(new_viscosities):
+        velocity_ratio[~is_delta] = new_viscosities / viscosity_old
+
+    def original(column):
+        if column in dataframe.columns:
+            return dataframe[column].values
+        return np.full(n_rows, viscosity_old, dtype=float)
+
+    def scaled(column, ratio):
+        return original(column)[None, :] * ratio[:, None]
+
+    # column-major block so that each column of every variant is contiguous
+    block = np.empty((n_variants * n_rows, len(float_columns)), order="F")
+    variants = {}
+    for idx, column in enumerate(float_columns):
+        variants[column] = block[:, idx].reshape(n_variants, n_rows)
+        variants[column][:n_base] = original(column)
+        if column not in changed:
+            variants[column][n_base:] = original(column)
+    modified = {column : values[n_base:] for column, values in variants.items()}
+
+    for column in changed:
+        if column in VELOCITY_COLUMNS or column == 'u_tau':
+            modified[column][:] = scaled(column, velocity_ratio)
+    modified['u_plus'][:] = modified['VELOC:0'] / modified['u_tau']
+    modified['viscosity'][is_delta] = original('viscosity')
+    modified['viscosity'][~is_delta] = new_viscosities[:, None]
+    if len(new_deltas):
+        modified['Points:1'][is_delta] = scaled('Points:1', y_ratio[is_delta])
+        modified['Points:1'][~is_delta] = original('Points:1')
+        modified['delta'][is_delta] = mirror_y(modified['Points:1'][is_delta], new_deltas[:, None])
+        modified['delta'][~is_delta] = original('delta')
+    modified['y_plus'][:] = modified['delta'] * modified['u_tau'] / modified['viscosity']
+
+    result = pd.DataFrame(block, columns=float_columns, copy=False)
+    if other_columns:
+        for column in other_columns:
+            result[column] = np.tile(dataframe[column].values, n_variants)
+        result = result[columns]
+    return result
+
+def split_variants(dataframe, n_rows):
+    """
+    Split dataframe returned by augment into list of dataframes of each
+    variant (n_rows is the length of the original dataframe).
+    """
+    return [dataframe.iloc[start:start + n_rows] for start in range(0, len(dataframe), n_rows)]
+
+
 #Function to get samples
 def get_complete_sample(path=None, FILE=None):
     """
@@ -165,7 +280,7 @@ def get_complete_sample(path=None, FILE=None):
     data_list = []
     #iterate through all data files and generate sampled and modified data
     for file in files:
-        dataframe = pd.read_csv(file)
+        dataframe = read_snapshot(file)
         data_list.append(return_modified_sample(dataframe))
     final_df = pd.concat(data_list, axis=0, ignore_index=True)
     return final_df
@@ -180,23 +295,12 @@ def return_modified_sample(dataframe, sample_size=10000, new_delta=None, new_vis
     generated data.
     Specify inclusive to include sample drawn from original data as part of the final return dataset
     """
-    final = []
-
     data = dataframe.dataframe.sample(sample_size)
     #data['viscosity'] = viscosity_original
+    # modify sampled data for all new deltas and viscosities at once
+    final_df = augment(data, dataframe.delta, dataframe.Viscosity, new_deltas=new_delta,
+                       new_viscosities=new_viscosity, inclusive=inclusive)
+    #combine original and modified data
     if keep_original:
-        final.append(dataframe.dataframe)
-    if inclusive:
-        final.append(data)
-    # iterate through list of new deltas and viscosity and modify sampled data
-    if not(new_delta is None):
-        for delta in new_delta:
-            mod_data = modify_delta(data, dataframe.delta, delta)
-            final.append(mod_data)
-    if not(new_viscosity is None):
-        for viscosity in new_viscosity:
-            mod_data = modify_viscosity(data, dataframe.Viscosity, viscosity)
-            final.append(mod_data)
-    #combine original and modified data    
-    final_df = pd.concat(final, axis=0, ignore_index=True)
+        final_df = pd.concat([dataframe.dataframe, final_df], axis=0, ignore_index=True)
     return final_df
@@ -0,0 +1,208 @@
+"""
+Memory mapped datasets for training data generated from snapshots.
+Every column is stored as a raw binary float array (same layout as the
+snapshot cache) together with a json schema holding the metadata of each block
+of rows (source snapshot, delta, viscosity, sampling). Datasets are opened
+without copying the data, and train/validation splits are views.
+"""
+
+#import libraries
+import os, json, shutil
+import numpy as np
+import pandas as pd
+from snapshot_cache import SCHEMA_FILE, read_schema, read_snapshot
+
+### ---------- GLOBAL VARIABLES -----------------###
+DTYPE = np.dtype("<f8")
+# file holding the block number of each row
+BLOCK_FILE = "blocks.bin"
+BLOCK_DTYPE = np.dtype("<i4")
+# rows written at once when filling missing columns
+CHUNK_SIZE = 1000000
+# suffix of the directory a dataset is written in, renamed when complete
+TMP_SUFFIX = ".tmp"
+
+
+def is_dataset(path):
+    """
+    Check if path is a dataset written with DatasetWriter.
+    """
+    if not os.path.isfile(os.path.join(path, SCHEMA_FILE)):
+        return False
+    return read_schema(path)["metadata"].get("type") == "dataset"
+
+
+class DatasetWriter(object):
+    """
+    Write a dataset block by block, e.g. one block per delta or viscosity
+    variant of a snapshot. Blocks are appended to the column files, so the
+    complete dataset is never held in memory.
+    Columns missing from a block are filled with NaN (as in pd.concat).
+    The dataset is written in path + TMP_SUFFIX, renamed to path by close, so
+    that an interrupted run leaves no incomplete dataset at path (and a
+    dataset already at path is replaced only when the new one is complete).
+    """
+    def __init__(self, path):
+        if os.path.exists(path):
+            assert is_dataset(path), "%s exists and is not a dataset" % path
+        self.path = path
+        self.tmp_path = path.rstrip("/") + TMP_SUFFIX
+        # left by an interrupted run
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+        self.columns = []
+        self.blocks = []
+        self.n_rows = 0
+
+    def column_path(self, idx):
+        return os.path.join(self.tmp_path, "col_%04d.bin" % idx)
+
+    def append(self, dataframe, **metadata):
+        """
+        Append rows of dataframe as a new block, with metadata describing the
+        block (e.g. source=..., delta=..., viscosity=..., sample_size=...).
+        """
+        for column in dataframe.columns:
+            if column not in self.columns:
+                self.columns.append(column)
+                self.fill_missing(len(self.columns) - 1, self.n_rows)
+        for idx, column in enumerate(self.columns):
+            if column in dataframe.columns:
+                with open(self.column_path(idx), "ab") as column_file:
+                    np.asarray(dataframe[column].values, dtype=DTYPE).tofile(column_file)
+            else:
+                self.fill_missing(idx, len(dataframe))
+        with open(os.path.join(self.tmp_path, BLOCK_FILE), "ab") as block_file:
+            np.full(len(dataframe), len(self.blocks), dtype=BLOCK_DTYPE).tofile(block_file)
+        metadata["n_rows"] = len(dataframe)
+        self.blocks.append(metadata)
+        self.n_rows += len(dataframe)
+
+    def fill_missing(self, idx, n_rows):
+        with open(self.column_path(idx), "ab") as column_file:
+            for start in range(0, n_rows, CHUNK_SIZE):
+                np.full(min(CHUNK_SIZE, n_rows - start), np.nan, dtype=DTYPE).tofile(column_file)
+
+    def close(self, shuffle=True, seed=0):
+        """
+        Write schema of dataset and move it to path. With shuffle, rows are
+        permuted (one column in memory at a time) so that contiguous slices are
+        random samples and train/validation splits can be taken as views.
+        """
+        files = [self.column_path(idx) for idx in range(len(self.columns))]
+        files.append(os.path.join(self.tmp_path, BLOCK_FILE))
+        if shuffle:
+            permutation = np.random.RandomState(seed).permutation(self.n_rows)
+            for path in files:
+                dtype = BLOCK_DTYPE if path.endswith(BLOCK_FILE) else DTYPE
+                np.fromfile(path, dtype=dtype)[permutation].tofile(path)
+        columns = [dict(name=column, file=os.path.basename(self.column_path(idx)), dtype=DTYPE.str)
+                   for idx, column in enumerate(self.columns)]
+        metadata = dict(type="dataset", blocks=self.blocks, block_file=BLOCK_FILE,
+                        shuffle_seed=seed if shuffle else None)
+        schema = dict(n_rows=self.n_rows, columns=columns, metadata=metadata)
+        with open(os.path.join(self.tmp_path, SCHEMA_FILE), "w") as schema_file:
+            json.dump(schema, schema_file, indent=1, default=lambda value: value.item())
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.rename(self.tmp_path, self.path)
+        return self.path
+
+
+class CSVWriter(object):
+    """
+    Write blocks to a csv file as they are appended (same interface as
+    DatasetWriter). columns fixes the columns of the file, otherwise the
+    columns of the first block are used. Block metadata is not stored.
+    """
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = columns
+        self.n_rows = 0
+
+    def append(self, dataframe, **metadata):
+        if self.columns is None:
+            self.columns = list(dataframe.columns)
+        dataframe.reindex(columns=self.columns).to_csv(self.path, mode="a" if self.n_rows else "w",
+                                                       header=not self.n_rows, index=False)
+        self.n_rows += len(dataframe)
+
+    def close(self):
+        return self.path
+
+
+class MappedDataset(object):
+    """
+    Dataset written with DatasetWriter, opened as memory maps.
+    Dataframes returned are backed by the memory maps (no copy).
+    """
+    def __init__(self, path):
+        assert is_dataset(path), "%s is not a dataset" % path
+        self.path = path
+        self.schema = read_schema(path)
+        self.metadata = self.schema["metadata"]
+        self.blocks = self.metadata["blocks"]
+        self.n_rows = self.schema["n_rows"]
+        self.arrays = {}
+        for column in self.schema["columns"]:
+            self.arrays[column["name"]] = self.memmap(column["file"], column["dtype"])
+
+    def memmap(self, filename, dtype):
+        if not self.n_rows:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, filename), dtype=dtype, mode="r", shape=(self.n_rows,))
+
+    def __len__(self):
+        return self.n_rows
+
+    def __repr__(self):
+        return "MappedDataset(%s, rows=%d, blocks=%d)" % (self.path, self.n_rows, len(self.blocks))
+
+    @property
+    def columns(self):
+        return list(self.arrays)
+
+    def block_ids(self):
+        """
+        Return block number of each row (index into blocks).
+        """
+        return self.memmap(self.metadata["block_file"], BLOCK_DTYPE)
+
+    def dataframe(self, columns=None, start=0, stop=None):
+        """
+        Return dataframe of rows start:stop of columns (all if None), as a
+        view of the memory maps.
+        """
+        if columns is None:
+            columns = self.columns
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        data = {column: self.arrays[column][start:stop] for column in columns}
+        return pd.DataFrame(data, columns=list(columns), index=pd.RangeIndex(start, stop), copy=False)
+
+    def split(self, test_size=0.3, columns=None):
+        """
+        Return train and validation dataframes as views of the dataset: the
+        last test_size fraction of rows is used for validation. Rows are
+        shuffled when the dataset is written, so this is a random split.
+        """
+        n_train = self.n_rows - int(np.ceil(test_size * self.n_rows))
+        return (self.dataframe(columns, stop=n_train),
+                self.dataframe(columns, start=n_train))
+
+
+def open_dataset(path):
+    return MappedDataset(path)
+
+
+def read_training_data(path, columns=None):
+    """
+    Read training data from a dataset directory (memory mapped) or from a
+    csv file (through the snapshot cache).
+    """
+    if is_dataset(path):
+        dataset = open_dataset(path)
+        if columns is not None:
+            columns = [column for column in columns if column in dataset.columns]
+        return dataset.dataframe(columns)
+    return read_snapshot(path, columns=columns)
@@ -0,0 +1,149 @@
+"""
+Cache of xgboost DMatrix objects keyed by a content hash of the features and
+labels they are built from.
+Matrices are kept in memory and training / validation matrices are saved as
+xgboost binary buffers, so that repeated runs on the same training file skip
+the DataFrame to DMatrix conversion. The number of saved buffers is bounded,
+least recently used buffers are deleted first.
+"""
+
+#import libraries
+import os, hashlib
+from collections import OrderedDict
+import numpy as np
+import xgboost as xgb
+
+### ---------- GLOBAL VARIABLES -----------------###
+CACHE_FOLDER = ".dmatrix_cache"
+# number of matrices kept in memory by a cache
+MAX_MATRICES = 8
+# number of buffers kept in the cache folder (least recently used are deleted)
+MAX_BUFFERS = 16
+
+
+def content_hash(x, y=None):
+    """
+    Return hash of the column names and values of features x and labels y.
+    """
+    digest = hashlib.sha1()
+    for data in [x, y]:
+        if data is None:
+            continue
+        if hasattr(data, "columns"):
+            columns = list(data.columns)
+            arrays = [data[column].values for column in columns]
+        else:
+            columns = [getattr(data, "name", None)]
+            arrays = [np.asarray(data)]
+        digest.update(repr((columns, len(data))).encode())
+        for values in arrays:
+            digest.update(np.ascontiguousarray(values).view(np.uint8))
+    return digest.hexdigest()
+
+
+def dmatrix_nbytes(matrix):
+    """
+    Estimate of memory held by a DMatrix (dense float32 features and labels).
+    """
+    return 4 * matrix.num_row() * (matrix.num_col() + 1)
+
+
+class DMatrixCache(object):
+    """
+    Cache of DMatrix objects.
+    Input:
+        - cache_dir = folder of the binary buffers, None to keep matrices only
+          in memory
+        - max_matrices = number of matrices kept in memory (least recently
+          used are dropped first)
+        - max_buffers = number of buffers kept in cache_dir (least recently
+          used are deleted first)
+    """
+    def __init__(self, cache_dir=CACHE_FOLDER, max_matrices=MAX_MATRICES, max_buffers=MAX_BUFFERS):
+        self.cache_dir = cache_dir
+        self.max_matrices = max_matrices
+        self.max_buffers = max_buffers
+        self.matrices = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.matrices)
+
+    def buffer_path(self, key):
+        return os.path.join(self.cache_dir, "%s.buffer" % key)
+
+    def get(self, x, y=None, persist=True):
+        """
+        Return DMatrix of features x and labels y, from memory, from a saved
+        buffer or built if not cached. The matrices built are saved as
+        buffers only with persist (training and validation data, not the
+        inputs of predictions).
+        """
+        key = content_hash(x, y)
+        if key in self.matrices:
+            self.hits += 1
+            self.matrices.move_to_end(key)
+            return self.matrices[key]
+        if self.cache_dir and os.path.isfile(self.buffer_path(key)):
+            self.hits += 1
+            matrix = xgb.DMatrix(self.buffer_path(key))
+            # time of last use, for the eviction of buffers
+            os.utime(self.buffer_path(key))
+        else:
+            self.misses += 1
+            matrix = xgb.DMatrix(data=x, label=y, feature_names=list(x.columns))
+            if self.cache_dir and persist:
+                self.save(key, matrix)
+        self.matrices[key] = matrix
+        while len(self.matrices) > self.max_matrices:
+            self.matrices.popitem(last=False)
+        return matrix
+
+    def save(self, key, matrix):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = "%s.tmp-%d" % (self.buffer_path(key), os.getpid())
+        matrix.save_binary(temp_path, silent=True)
+        os.replace(temp_path, self.buffer_path(key))
+        self.evict_buffers()
+
+    def buffers(self):
+        """
+        Return paths of the buffers of the cache folder, least recently used
+        first.
+        """
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return []
+        paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".buffer")]
+        return sorted(paths, key=os.path.getmtime)
+
+    def evict_buffers(self):
+        for path in self.buffers()[:-self.max_buffers or None]:
+            os.remove(path)
+
+    def nbytes(self):
+        """
+        Estimate of memory held by the matrices in memory.
+        """
+        return sum(dmatrix_nbytes(matrix) for matrix in self.matrices.values())
+
+    def clear(self, buffers=False):
+        """
+        Drop matrices from memory, and delete the saved buffers with buffers.
+        """
+        self.matrices.clear()
+        if buffers:
+            for path in self.buffers():
+                os.remove(path)
+
+
+# cache shared by models and tests of a run
+default_cache = DMatrixCache()
+
+
+def frame_nbytes(*frames):
+    """
+    Memory held by dataframes / series (None are ignored).
+    """
+    return int(sum(frame.memory_usage(index=True, deep=False).sum() if hasattr(frame, "columns")
+                   else frame.memory_usage(index=True, deep=False) for frame in frames if frame is not None))
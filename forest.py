@@ -0,0 +1,217 @@
+"""
+Trained xgboost boosters compiled to flat numpy arrays, with a vectorized
+evaluator giving the predictions of the booster (within float32 rounding)
+without xgboost or a DMatrix.
+Trees are stored as complete binary trees of the depth of the deepest tree
+(leaves moved down to the bottom level), in arrays of feature, threshold and
+default direction of missing values of the splits, and of leaf values. The
+children of node i are 2i+1 and 2i+2, so every row walks all trees together
+for depth steps with a few array lookups per step. Compiled forests are saved
+as .npz files, quick to load in solvers and post processing jobs. A
+CompiledForest can be given as model to Make_test.
+"""
+
+#import libraries
+import json
+import numpy as np
+
+### ---------- GLOBAL VARIABLES -----------------###
+# rows evaluated at once (a few arrays of rows x trees, kept small for the
+# processor cache)
+BATCH_SIZE = 4096
+# trees are stored as complete binary trees: 2 ** depth nodes per tree
+MAX_DEPTH = 12
+# objectives predicting the margin (identity link)
+IDENTITY_OBJECTIVES = ["reg:squarederror", "reg:linear", "reg:pseudohubererror", "reg:absoluteerror",
+                       "reg:quantileerror"]
+
+
+def booster_json(booster):
+    """
+    Return json model of booster (xgboost Booster or sklearn model). The raw
+    json holds the float32 thresholds and leaf values exactly.
+    """
+    if hasattr(booster, "get_booster"):
+        booster = booster.get_booster()
+    return json.loads(booster.save_raw(raw_format="json")), booster.feature_names
+
+
+def parse_base_score(value):
+    # '5E-1' or '[5E-1]' (xgboost >= 2)
+    return float(value.strip("[]").split(",")[0])
+
+
+def compile_booster(booster, iteration_range=None):
+    """
+    Return CompiledForest of the trees of booster.
+    Input:
+        - booster = trained xgboost Booster or sklearn model (gbtree or dart
+          booster, numerical splits, identity objective such as reg:squarederror)
+        - iteration_range = (begin, end) boosting rounds to use, as in
+          Booster.predict (all rounds if None)
+    """
+    model, feature_names = booster_json(booster)
+    learner = model["learner"]
+    objective = learner["objective"]["name"]
+    msg = "only identity objectives can be compiled, booster uses %s" %objective
+    assert objective in IDENTITY_OBJECTIVES, msg
+    gradient_booster = learner["gradient_booster"]
+    msg = "only gbtree and dart boosters can be compiled"
+    assert gradient_booster["name"] in ["gbtree", "dart"], msg
+    gbtree = gradient_booster["model"] if "model" in gradient_booster else gradient_booster["gbtree"]["model"]
+    trees = gbtree["trees"]
+    # dart: leaf values of each tree are scaled by its weight at prediction
+    weights = np.asarray(gradient_booster.get("weight_drop", [1.0] * len(trees)), dtype=np.float32)
+    # trees of each round
+    if "iteration_indptr" in gbtree:
+        indptr = gbtree["iteration_indptr"]
+    else:
+        per_round = int(gbtree["gbtree_model_param"]["num_parallel_tree"])
+        indptr = list(range(0, len(trees) + 1, per_round))
+    if iteration_range is not None and iteration_range[1] > 0:
+        trees = trees[indptr[iteration_range[0]]:indptr[iteration_range[1]]]
+        weights = weights[indptr[iteration_range[0]]:indptr[iteration_range[1]]]
+
+    left = [np.asarray(tree["left_children"]) for tree in trees]
+    right = [np.asarray(tree["right_children"]) for tree in trees]
+    depth = max([tree_depth(*children) for children in zip(left, right)] or [0])
+    msg = "trees of depth %d are too deep to compile (at most %d)" %(depth, MAX_DEPTH)
+    assert depth <= MAX_DEPTH, msg
+    # complete binary tree of the given depth: children of node i are 2i+1
+    # and 2i+2, leaves of the trees are moved down to the bottom level
+    n_nodes = 2 ** depth - 1
+    feature = np.zeros((len(trees), n_nodes), dtype=np.int32)
+    threshold = np.full((len(trees), n_nodes), np.inf, dtype=np.float32)
+    default_left = np.ones((len(trees), n_nodes), dtype=bool)
+    value = np.zeros((len(trees), 2 ** depth), dtype=np.float32)
+    for index, tree in enumerate(trees):
+        assert not any(tree["split_type"]), "categorical splits are not supported"
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        leaf_values = conditions * weights[index]
+        stack = [(0, 0)]
+        while stack:
+            node, position = stack.pop()
+            if left[index][node] == -1:
+                # all nodes of the bottom level below the leaf
+                width = 1
+                while position < n_nodes:
+                    position = 2 * position + 1
+                    width *= 2
+                value[index, position - n_nodes:position - n_nodes + width] = leaf_values[node]
+                continue
+            feature[index, position] = tree["split_indices"][node]
+            threshold[index, position] = conditions[node]
+            default_left[index, position] = tree["default_left"][node]
+            stack += [(left[index][node], 2 * position + 1), (right[index][node], 2 * position + 2)]
+
+    return CompiledForest(feature=feature, threshold=threshold, default_left=default_left, value=value,
+                          base_score=parse_base_score(learner["learner_model_param"]["base_score"]),
+                          num_feature=int(learner["learner_model_param"]["num_feature"]),
+                          feature_names=feature_names)
+
+
+def tree_depth(left, right):
+    """
+    Return number of splits on the longest path from the root to a leaf.
+    """
+    depth = 0
+    level = [0]
+    while True:
+        level = [child for node in level for child in (left[node], right[node]) if child != -1]
+        if not level:
+            return depth
+        depth += 1
+
+
+class CompiledForest(object):
+    """
+    Forest of complete binary trees (see compile_booster): arrays of trees x
+    nodes of feature, threshold and default direction of the splits, and
+    trees x leaves of leaf values. Predictions are the sum of the leaf values
+    reached in each tree plus base_score.
+    """
+    def __init__(self, feature, threshold, default_left, value, base_score, num_feature, feature_names=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.value = value
+        self.base_score = base_score
+        self.num_feature = num_feature
+        self.feature_names = list(feature_names) if feature_names else None
+        self.n_trees, self.n_nodes = feature.shape
+        self.depth = int(np.log2(self.n_nodes + 1))
+
+    def __repr__(self):
+        return "CompiledForest(%d trees, depth %d)" %(self.n_trees, self.depth)
+
+    def features(self, data):
+        """
+        Return float32 array of the features of data (dataframe, columns
+        selected by name, or array in the order of the training features).
+        """
+        if not hasattr(data, "shape"):
+            # as xgboost models given an input they cannot predict on
+            raise TypeError("CompiledForest predicts on arrays or dataframes, not %s" %type(data).__name__)
+        if hasattr(data, "columns") and self.feature_names:
+            data = data[self.feature_names]
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        msg = "data has %d features, forest was trained on %d" %(data.shape[1], self.num_feature)
+        assert data.shape[1] == self.num_feature, msg
+        return data
+
+    def leaves(self, x):
+        """
+        Return leaf reached by each row of x in each tree (rows x trees, index
+        in the bottom level).
+        """
+        # flat indices: node of each tree, feature of each row
+        tree_offsets = np.arange(self.n_trees, dtype=np.int32) * self.n_nodes
+        row_offsets = np.arange(len(x), dtype=np.int32)[:, None] * x.shape[1]
+        feature = self.feature.ravel()
+        threshold = self.threshold.ravel()
+        missing = np.isnan(x).any()
+        x = x.ravel()
+        nodes = np.zeros((len(row_offsets), self.n_trees), dtype=np.int32)
+        for _ in range(self.depth):
+            index = nodes + tree_offsets
+            values = x[row_offsets + feature[index]]
+            go_right = ~(values < threshold[index])
+            if missing:
+                go_right = np.where(np.isnan(values), ~self.default_left.ravel()[index], go_right)
+            nodes = 2 * nodes + 1 + go_right
+        return nodes - self.n_nodes
+
+    def predict(self, data, batch_size=BATCH_SIZE):
+        """
+        Return predictions of the forest on data, evaluated batch_size rows
+        at a time.
+        """
+        x = self.features(data)
+        predictions = np.empty(len(x), dtype=np.float32)
+        leaf_offsets = np.arange(self.n_trees, dtype=np.int32) * self.value.shape[1]
+        value = self.value.ravel()
+        for start in range(0, len(x), batch_size):
+            leaves = self.leaves(x[start:start + batch_size]) + leaf_offsets
+            predictions[start:start + batch_size] = value[leaves].sum(axis=1, dtype=np.float32) + \
+                np.float32(self.base_score)
+        return predictions
+
+    def save(self, path):
+        """
+        Save forest to path (.npz).
+        """
+        np.savez(path, feature=self.feature, threshold=self.threshold, default_left=self.default_left,
+                 value=self.value, base_score=self.base_score, num_feature=self.num_feature,
+                 feature_names=np.asarray(self.feature_names or [], dtype=str))
+
+
+def load_forest(path):
+    """
+    Return CompiledForest saved in path.
+    """
+    with np.load(path) as arrays:
+        fields = {name: arrays[name] for name in arrays.files}
+    fields["num_feature"] = int(fields["num_feature"])
+    fields["base_score"] = float(fields["base_score"])
+    fields["feature_names"] = [str(name) for name in fields["feature_names"]] or None
+    return CompiledForest(**fields)
@@ -7,13 +7,22 @@ import matplotlib.pyplot as plt
 plt.style.use('seaborn-pastel')
 import numpy as np
 import pandas as pd
+import os
 import clean_dataframe as cd
+from grid import DenseFields
+from dataset import MappedDataset
+from dmatrix_cache import default_cache, dmatrix_nbytes, frame_nbytes
+from tuning import successive_halving, cv_search, CVFolds
+from checkpoint import Checkpoint
+from shards import ShardIterator, list_shards, is_shard_directory, shard_dmatrix, BATCH_SIZE
+from augmentation import share_dataframe, attach_dataframe
+from metrics import ErrorMetrics, PlaneProfile
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib.lines as mlines
 import matplotlib.transforms as mtransforms
 
 
 # sklearn libraries
-from sklearn.metrics import r2_score
 from sklearn.model_selection import train_test_split, KFold, GridSearchCV, RandomizedSearchCV
 from sklearn.model_selection import cross_val_score
 from sklearn.metrics import mean_squared_error
@@ -22,17 +31,32 @@ from sklearn.externals import joblib
 # xgboost libraries
 import xgboost as xgb
 
+# tree methods of XGBoost_Model (None: as set in params)
+ENGINES = [None, "exact", "approx", "hist"]
+# folder of the external memory caches of shards
+EXTERNAL_MEMORY_CACHE = ".external_memory"
+
 class Make_test(object):
     """
     Class for making test using a saved model.
+    With chunksize, the test file (path to snapshot or dataframe) is cleaned,
+    predicted and scored chunk by chunk, keeping only the metrics and the
+    profiles over the y planes (see stream).
     """
-    def __init__(self, model, test_file):
+    def __init__(self, model, test_file, chunksize=None):
         self.model = model
+        self.chunksize = chunksize
+        if chunksize:
+            self.stream(test_file, chunksize)
+            return
         self.test_file = cd.clean_dataframe(test_file)
         self.x_actual, self.y_actual = cd.X_Y_split(self.test_file)
         self.y_actual = self.y_actual.values.ravel()
         self.predictions = self.make_predictions()
         self.test_file["predictions"] = self.predictions
+        # computed on first use (see scores and compare_values)
+        self.results = None
+        self.comparison = None
 
     def __call__(self):
         return self.test_file
@@ -46,8 +70,36 @@ class Make_test(object):
     def make_predictions(self):
         self.predictions = self.model.predict(self.x_actual)
         return self.predictions
-    
+
+    def predict_chunk(self, x):
+        return self.model.predict(x)
+
+    def stream(self, test_file, chunksize):
+        """
+        Clean, predict and score test_file chunk by chunk. Memory is bounded by
+        the chunk size: predictions are not kept, only the running metrics
+        (self.metrics) and the sums of actual values and predictions over each
+        y plane (self.profile) used by make_plot.
+        """
+        self.test_file = self.x_actual = self.y_actual = self.predictions = None
+        self.results = self.comparison = None
+        self.metrics = ErrorMetrics()
+        self.profile = PlaneProfile(["u_plus", "y_plus", "predictions"])
+        if isinstance(test_file, str):
+            chunks = cd.iter_clean_dataframe(test_file, chunksize=chunksize)
+        else:
+            chunks = (cd.clean_dataframe(test_file.iloc[start:start + chunksize])
+                      for start in range(0, len(test_file), chunksize))
+        for chunk in chunks:
+            x, y = cd.X_Y_split(chunk)
+            predictions = self.predict_chunk(x)
+            self.metrics.update(y.values, predictions, chunk["y_plus"].values)
+            self.profile.update(chunk[["Points:1", "u_plus", "y_plus"]].assign(predictions=predictions))
+        self.n_rows = self.metrics.n
+        return self.metrics
+
     def get_full_dataframe(self):
+        assert not self.chunksize, "predictions are not kept when testing by chunks"
         self.full_dataframe = self.test_file.copy()
         self.full_dataframe["predictions"] = self.predictions
         return self.full_dataframe
@@ -59,14 +111,30 @@ class Make_test(object):
         both values equal or greater than threshold
         Specify plot to get plot of comparison
         """
-        comparison = pd.DataFrame(dict(ACTUALS=self.y_actual, PREDICTIONS=self.predictions))
+        assert not self.chunksize, "predictions are not kept when testing by chunks"
+        if self.comparison is None:
+            self.comparison = pd.DataFrame(dict(ACTUALS=self.y_actual, PREDICTIONS=self.predictions))
+        comparison = self.comparison
         if threshold:
-            comparison = comparison[np.abs(comparison.ACTUALS - comparison.PREDICTIONS >= threshold)]
+            comparison = comparison[np.abs(comparison.ACTUALS - comparison.PREDICTIONS) >= threshold]
         if plot:
-            plot_predictions(comparison, colormap=True)
+            # plot_predictions adds a column to the dataframe it is given
+            plot_predictions(comparison.copy(), colormap=True)
         if return_values:
             return comparison
 
+    def scores(self):
+        """
+        Return dict of all metrics of the model on the test data (rmse, mse,
+        mae, r2, max_error, mean_error and errors per y+ band, see
+        metrics.ErrorMetrics), computed in one pass on first call.
+        """
+        if self.results is None:
+            if not self.chunksize:
+                self.metrics = ErrorMetrics().update(self.y_actual, self.predictions, self.test_file["y_plus"].values)
+            self.results = self.metrics.results()
+        return self.results
+
     def score(self, metric="rmse", plot_residuals=False):
         """
         Get score of model with test data depending on which metric.
@@ -74,21 +142,10 @@ class Make_test(object):
         Specify plot_residuals to show the distribution of the residuals and
         the fitted values
         """
-        error = self.y_actual - self.predictions
-        error_squared = np.square(error)
-        mae = np.mean(error)
-        mse = np.mean(error_squared)
-        rmse = np.sqrt(mse)
-        r2 = r2_score(self.predictions, self.y_actual)
-        if metric == "rmse":
-            self.test_score = rmse
-        elif metric == "mse":
-            self.test_score = mse
-        elif metric == "mae":
-            self.test_score = mae
-        elif metric == "r2":
-            self.test_score = r2
+        assert metric in self.scores(), "unknown metric %s" %metric
+        self.test_score = self.scores()[metric]
         if plot_residuals:
+            assert not self.chunksize, "residuals are not kept when testing by chunks"
             fig, ax = plt.subplots()
             ax.scatter(self.predictions, self.predictions-self.y_actual,
                         c="b", s=40, alpha=0.5)
@@ -97,8 +154,13 @@ class Make_test(object):
             ax.set_ylabel("Residuals")
             ax.set_xlabel("Predicted Values")
         return float(self.test_score)
-    
+
     def make_plot(self, title="Test", save=False):
+        if self.chunksize:
+            # profiles are the means over the y planes (one row per plane)
+            grid = int(np.cbrt(self.n_rows) // 2)
+            plot_wall_test(self.profile.means(), title, half_channel_grids=grid, prediction=True, save=save)
+            return
         self.full_dataframe = self.test_file
         grid = int(np.cbrt(len(self.test_file)) // 2)
         plot_wall_test(self.full_dataframe, title ,half_channel_grids=grid, prediction=True, save=False)
@@ -110,12 +172,12 @@ class XGB_test(Make_test):
     test)
     """
     import xgboost as xgb
-    def __init__(self, model, test_file):
-        Make_test.__init__(self, model, test_file)
+    def __init__(self, model, test_file, chunksize=None):
+        Make_test.__init__(self, model, test_file, chunksize=chunksize)
 
 
     def make_predictions(self):
-        self.test_matrix = xgb.DMatrix(data=self.x_actual, feature_names=self.x_actual.columns)
+        self.test_matrix = default_cache.get(self.x_actual, persist=False)
         try:
             self.predictions = self.model.predict(self.test_matrix)
         except TypeError as exc:
@@ -123,7 +185,13 @@ class XGB_test(Make_test):
             print("Type Error Detected, using already instantiated x_actual")
             self.predictions = self.model.predict(self.x_actual)
         return self.predictions
-    
+
+    def predict_chunk(self, x):
+        # chunks are not cached: each is predicted once
+        if isinstance(self.model, xgb.Booster):
+            return self.model.predict(xgb.DMatrix(x))
+        return self.model.predict(x)
+
     # plot importance of features contribution in model, using the "gain"
     # metric
     def plot_importance(self, importance_type="gain", **kwargs):
@@ -165,6 +233,12 @@ def plot_wall_test(dataframe, title, half_channel_grids, prediction=None,
         plt.show()
 
 def return_average(dataframe, column_name):
+    """
+    Return mean of column over each y plane, ordered by y. dataframe can also
+    be DenseFields of the snapshot.
+    """
+    if isinstance(dataframe, DenseFields):
+        return dataframe.plane_means(column_name)
     return dataframe.groupby("Points:1")[column_name].mean().values
 
 # Function to plot predictions against actual response values
@@ -204,28 +278,116 @@ class XGBoost_Model(object):
     """
     Class for building a model using xgboost algorithm
     Model can be tuned as well
+    dataframe: clean dataframe, or MappedDataset (see dataset.py) which is split
+    into train and validation views and cleaned if required.
+    dmatrix_cache: DMatrixCache (see dmatrix_cache.py) used to build the DMatrix
+    objects, shared default cache if None.
+    engine: tree method used by train_model and fit, None to use params as
+    given. With "hist", the input is quantized once into QuantileDMatrix
+    objects (max_bin bins per feature) which are used for all training rounds.
+    nthread: number of threads used by xgboost (params or all cores if None)
+    dataframe can also be a directory of shards (csv files or datasets, see
+    shards.py), read batch_size rows at a time and trained out of core with
+    the hist engine with train_model (fit needs the data in memory).
     """
-    def __init__(self, params, dataframe):
+    def __init__(self, params, dataframe, dmatrix_cache=None, engine=None, max_bin=256, nthread=None,
+                 batch_size=BATCH_SIZE):
+        assert engine in ENGINES, "engine should be one of %s" % ENGINES
         self.params = params
         self.dataframe = dataframe
+        self.dmatrix_cache = default_cache if dmatrix_cache is None else dmatrix_cache
+        self.engine = engine
+        self.max_bin = max_bin
+        self.nthread = nthread
+        if is_shard_directory(dataframe):
+            assert engine in [None, "hist"], "shards are trained with the hist engine"
+            self.engine = "hist"
         self.model = xgb.XGBRegressor(**params)
-        self.train_data, self.validation_data = train_test_split(self.dataframe, test_size=0.3, random_state=100)
+        self.model.set_params(**self.engine_params(sklearn=True))
+        if is_shard_directory(dataframe):
+            self.init_shards(dataframe, batch_size)
+            return
+        if isinstance(dataframe, MappedDataset):
+            self.train_data, self.validation_data = split_dataset(dataframe, test_size=0.3)
+        else:
+            self.train_data, self.validation_data = train_test_split(self.dataframe, test_size=0.3, random_state=100)
         train_x, train_y = cd.X_Y_split(self.train_data)
         validation_x, validation_y = cd.X_Y_split(self.validation_data)
-        self.dtrain = xgb.DMatrix(data=train_x, label=train_y, feature_names=train_x.columns)
-        self.dvalidation = xgb.DMatrix(data=validation_x, label=validation_y, feature_names=validation_x.columns)
+        if engine == "hist":
+            self.dtrain = quantile_dmatrix(train_x, train_y, max_bin=max_bin, nthread=nthread)
+            self.dvalidation = quantile_dmatrix(validation_x, validation_y, max_bin=max_bin, nthread=nthread, ref=self.dtrain)
+        else:
+            self.dtrain = self.dmatrix_cache.get(train_x, train_y)
+            self.dvalidation = self.dmatrix_cache.get(validation_x, validation_y)
         self.eval_matrix  = [(self.dtrain,"train"),(self.dvalidation,"validation")]
         self.eval_set = [(train_x,train_y),(validation_x,validation_y)]
+
+    def init_shards(self, path, batch_size):
+        """
+        Build external memory DMatrix objects of the shards of path, split into
+        train and validation rows batch by batch.
+        """
+        shards = list_shards(path)
+        print("Shards\t\t:\t%d" %len(shards))
+        if not os.path.isdir(EXTERNAL_MEMORY_CACHE):
+            os.mkdir(EXTERNAL_MEMORY_CACHE)
+        self.train_data, self.validation_data = None, None
+        self.iterators = []
+        for part in ["train", "validation"]:
+            cache_prefix = os.path.join(EXTERNAL_MEMORY_CACHE, "%s_%d" %(part, os.getpid()))
+            self.iterators.append(ShardIterator(shards, batch_size=batch_size, part=part, cache_prefix=cache_prefix))
+        self.dtrain = shard_dmatrix(self.iterators[0], max_bin=self.max_bin, nthread=self.nthread)
+        self.dvalidation = shard_dmatrix(self.iterators[1], max_bin=self.max_bin, nthread=self.nthread, ref=self.dtrain)
+        self.eval_matrix  = [(self.dtrain,"train"),(self.dvalidation,"validation")]
+        self.eval_set = []
+
+    def engine_params(self, sklearn=False):
+        """
+        Return xgboost parameters of the engine (tree method, bins, threads),
+        named as in XGBRegressor if sklearn.
+        """
+        params = {}
+        if self.engine:
+            params["tree_method"] = self.engine
+        if self.engine == "hist":
+            params["max_bin"] = self.max_bin
+        if self.nthread:
+            params["n_jobs" if sklearn else "nthread"] = self.nthread
+        return params
     
     def __call__(self):
         return self.model
         
-    def train_model(self, num_rounds=50, parameters=None, plot=True):
+    def train_model(self, num_rounds=50, parameters=None, plot=True, xgb_model=None, run_dir=None,
+                    checkpoint_every=10, resume=False):
+        """
+        Train booster with xgboost train function.
+        xgb_model: booster (or saved model file) to continue training from, its
+        trees are kept and num_rounds rounds are added.
+        run_dir: directory where the booster and evaluation history are saved
+        every checkpoint_every rounds (see checkpoint.py). With resume, training
+        continues from the latest checkpoint of run_dir up to num_rounds, and
+        evals_result holds all rounds as in a run without interruption.
+        """
         if parameters != None:
             self.params.update(parameters)
         evals_result = {}
-        self.model = xgb.train(params =self.params, dtrain=self.dtrain, 
-                                       num_boost_round=num_rounds, early_stopping_rounds=50, evals=self.eval_matrix, verbose_eval=5, evals_result=evals_result)
+        params = dict(self.params, **self.engine_params())
+        if run_dir is None:
+            self.model = xgb.train(params =params, dtrain=self.dtrain, 
+                                           num_boost_round=num_rounds, early_stopping_rounds=50, evals=self.eval_matrix, verbose_eval=5, evals_result=evals_result,
+                                           xgb_model=xgb_model)
+            self.evals_result = evals_result
+            return
+        checkpoint = Checkpoint(run_dir, self.dtrain, period=checkpoint_every, early_stopping_rounds=50)
+        if resume and checkpoint.exists():
+            xgb_model = checkpoint.load()
+        # rounds left, none if the checkpointed run stopped early
+        remaining = 0 if checkpoint.stopped else num_rounds - checkpoint.rounds
+        self.model = xgb.train(params =params, dtrain=self.dtrain, num_boost_round=max(0, remaining),
+                               evals=self.eval_matrix, verbose_eval=5, xgb_model=xgb_model,
+                               callbacks=[checkpoint])
+        self.evals_result = checkpoint.history
         #if plot:
            # plot_fit(self)
 
@@ -237,20 +399,43 @@ class XGBoost_Model(object):
         """
         dataframe = cd.clean_dataframe(dataframe)
         new_val_x, new_val_y = cd.X_Y_split(dataframe)
-        new_val_mat = xgb.DMatrix(data=new_val_x, label=new_val_y, feature_names=new_val_x.columns)
+        if self.engine == "hist":
+            new_val_mat = quantile_dmatrix(new_val_x, new_val_y, max_bin=self.max_bin, nthread=self.nthread, ref=self.dtrain)
+        else:
+            new_val_mat = self.dmatrix_cache.get(new_val_x, new_val_y, persist=False)
         self.eval_matrix.append((new_val_mat, "validation_2"))
         self.eval_set.append((new_val_x, new_val_y))
 
     def predict(self, test_X):
-        dtest = xgb.DMatrix(test_X, feature_names=test_X.columns)
+        dtest = self.dmatrix_cache.get(test_X, persist=False)
         return self.model.predict(dtest)
 
+    def memory_usage(self, verbose=True):
+        """
+        Return memory (bytes) held by each representation of the training data:
+        train/validation dataframes, eval_set (features and labels used by fit)
+        and DMatrix objects (estimate, used by train_model).
+        eval_set duplicates the dataframes and the DMatrix objects duplicate
+        both in another format.
+        """
+        usage = dict(dataframes=frame_nbytes(self.train_data, self.validation_data),
+                     eval_set=frame_nbytes(*[data for pair in self.eval_set for data in pair]),
+                     dmatrix=sum(dmatrix_nbytes(matrix) for matrix, _ in self.eval_matrix))
+        if verbose:
+            for name, nbytes in usage.items():
+                print("%s\t:\t%.1f MB" %(name, nbytes / 1e6))
+            print("duplicates\t:\t%.1f MB" %((usage["eval_set"] + usage["dmatrix"]) / 1e6))
+        return usage
+
     def fit(self, x=None, y=None, n_estimators=100, plot=True, save_plot=False,save_path=None):
+        assert self.eval_set, "fit needs data in memory, use train_model for shards"
         if x != None:
             train_x, train_y = (x, y)
         else:
             train_x, train_y = self.eval_set[0]
         self.model.set_params(**{"n_estimators":n_estimators})
+        # with the hist engine, xgboost quantizes eval_set with the bins of the
+        # training data, as for the QuantileDMatrix objects of train_model
         #call_backs =[ xgb.callback.print_evaluation(period=2)]
         self.fitted_model=self.model.fit(train_x, train_y,
                 eval_set=self.eval_set , eval_metric="rmse",
@@ -275,18 +460,73 @@ class XGBoost_Model(object):
         return self.tuned_model
         """
 
-    def tune_model_parameter(self, parameter,  param_range, save_plot=False, save_path=None, randomized=True, n_iter = None, n_splits=5, data_size=0.1, fit_param=False):
-        if data_size:
+    def tune_model_parameter(self, parameter,  param_range, save_plot=False, save_path=None, randomized=True, n_iter = None, n_splits=5, data_size=0.1, fit_param=False, halving=False, folds=None, store=None):
+        if folds is not None:
+            tune_data = folds.data
+        elif data_size:
             tune_data = self.train_data.sample(frac=data_size)
-        results = tune_parameter(tune_data, parameter,param_range, save_plot=save_plot, save_path=save_path, randomized=randomized, n_iter=n_iter, n_splits=n_splits, estimator=self.model)
+        results = tune_parameter(tune_data, parameter,param_range, save_plot=save_plot, save_path=save_path, randomized=randomized, n_iter=n_iter, n_splits=n_splits, estimator=self.model, halving=halving, folds=folds, store=store)
         if fit_param:
             self.set_params(results.best_params_)
             self.model.set_params(**results.best_params_)
         return results
 
-    def tune_all_parameters(self, param_distribution, n_iter=10, cv=5, data_size=0.1):
-        tune_data = self.train_data.sample(frac=data_size)
-        results = tune_all(tune_data,self.model,param_distribution, n_iter=n_iter, n_splits=cv)
+    def tune_model_parameters(self, parameters, workers=1, cores=None, data_size=0.1, folds=None, **kwargs):
+        """
+        Tune each parameter of parameters (dict of parameter: range)
+        separately, running workers sweeps at the same time on one sample of
+        the training data (see tune_parameters). kwargs are passed to
+        tune_parameter. Returns dict of parameter: results.
+        folds: CVFolds (see tuning.py) of the tuning data, used instead of a
+        new sample.
+        """
+        tune_data = folds.data if folds is not None else self.train_data.sample(frac=data_size)
+        return tune_parameters(tune_data, parameters, self.model.get_params(), workers=workers, cores=cores, folds=folds, **kwargs)
+
+    def make_folds(self, data_size=0.1, n_splits=5, seed=0):
+        """
+        Return CVFolds of a sample (drawn with seed) of the training data, to
+        tune all parameters with the same folds.
+        """
+        return CVFolds(self.train_data.sample(frac=data_size, random_state=seed), n_splits=n_splits, seed=seed)
+
+    def tune_all_parameters(self, param_distribution, n_iter=10, cv=None, data_size=0.1, halving=False, folds=None, store=None):
+        """
+        Tune all parameters with randomized search, or successive halving if
+        halving (n_iter candidates, see tuning.py), or with the folds of
+        CVFolds (folds). Successive halving and folds evaluations are kept in
+        store (TrialStore) if given.
+        cv: number of folds (5 if None), set by folds if given.
+        """
+        if folds is not None:
+            msg = "cv=%s does not match the %d folds given" %(cv, folds.n_splits)
+            assert cv in [None, folds.n_splits], msg
+            cv = folds.n_splits
+        cv = cv or 5
+        tune_data = folds.data if folds is not None else self.train_data.sample(frac=data_size)
+        results = tune_all(tune_data,self.model,param_distribution, n_iter=n_iter, n_splits=cv, halving=halving, folds=folds, store=store)
+        return results
+
+
+def quantile_dmatrix(x, y=None, max_bin=256, nthread=None, ref=None):
+    """
+    Return QuantileDMatrix of features x and labels y for the hist engine.
+    Evaluation data should use the bins of the training data (ref).
+    """
+    return xgb.QuantileDMatrix(data=x, label=y, feature_names=list(x.columns), max_bin=max_bin,
+                               nthread=nthread, ref=ref)
+
+
+def split_dataset(dataset, test_size=0.3):
+    """
+    Split memory mapped dataset into train and validation views. Views are used
+    as they are if the dataset holds clean data, otherwise they are cleaned.
+    """
+    if all(column in dataset.columns for column in cd.REQUIRED_COLUMNS):
+        return dataset.split(test_size=test_size, columns=cd.REQUIRED_COLUMNS)
+    columns = [column for column in cd.input_columns() if column in dataset.columns]
+    train_data, validation_data = dataset.split(test_size=test_size, columns=columns)
+    return cd.clean_dataframe(train_data), cd.clean_dataframe(validation_data)
 
 
 # Function for tuning model using some parameters
@@ -302,7 +542,7 @@ def tune_parameter(model, data, parameters, n_splits=5):
     return grid_result
 """
 
-def tune_parameter(data, parameter, param_range, save_plot=False, randomized=False, save_path=None, n_iter = None, n_splits=5,estimator=None):
+def tune_parameter(data, parameter, param_range, save_plot=False, randomized=False, save_path=None, n_iter = None, n_splits=5,estimator=None, halving=False, folds=None, store=None):
     """
     Function to tune a parameter using either gridsearch or randomized search with possibility of cross validation.
     Input:
@@ -310,19 +550,35 @@ def tune_parameter(data, parameter, param_range, save_plot=False, randomized=Fal
         - parameter = string of parameter to be tuned. (works with XGBoost for now)
         - param_range = parameter search space
         - estimator = model to be tuned if existing already, if not a new default XGBRegressor model wil be created
+        - halving = use successive halving (see tuning.py) with n_iter
+          candidates (all values if None)
+        - folds = CVFolds of data (see tuning.py), to evaluate the candidates
+          with the xgboost api on the same folds, stopping each early
+        - store = TrialStore (see trial_store.py) keeping the evaluations of
+          successive halving or folds, to resume an interrupted search
     """
 
     train_x, train_y = cd.X_Y_split(data)
     param_grid = {parameter : list(param_range)}
-    kfold = KFold(n_splits=n_splits, random_state=7)
     if not estimator:
         estimator = xgb.XGBRegressor(objective="reg:squarederror", )
-    if randomized:
-        assert n_iter != None, "Missing number of iterations"
-        param_search = RandomizedSearchCV(estimator,param_grid,n_iter=n_iter,scoring="neg_mean_squared_error",cv=kfold)
+    if halving:
+        grid_result = successive_halving(data, param_grid, base_params=estimator_params(estimator),
+                                         n_candidates=n_iter or len(param_grid[parameter]), n_splits=n_splits,
+                                         store=store)
+        randomized = True
+    elif folds is not None:
+        grid_result = cv_search(folds, param_grid, base_params=estimator_params(estimator),
+                                n_candidates=n_iter if randomized else None, store=store)
+        randomized = True
     else:
-        param_search = GridSearchCV(estimator, param_grid, verbose=0, cv=kfold, scoring="neg_mean_squared_error")
-    grid_result = param_search.fit(train_x, train_y, verbose=0)
+        kfold = KFold(n_splits=n_splits, random_state=7)
+        if randomized:
+            assert n_iter != None, "Missing number of iterations"
+            param_search = RandomizedSearchCV(estimator,param_grid,n_iter=n_iter,scoring="neg_mean_squared_error",cv=kfold)
+        else:
+            param_search = GridSearchCV(estimator, param_grid, verbose=0, cv=kfold, scoring="neg_mean_squared_error")
+        grid_result = param_search.fit(train_x, train_y, verbose=0)
     
     print("Best: %f using %s" % (grid_result.best_score_, grid_result.best_params_))
     
@@ -349,6 +605,68 @@ def tune_parameter(data, parameter, param_range, save_plot=False, randomized=Fal
             fig.savefig("%s.png" %parameter)
     return grid_result
 
+def split_cores(cores, workers):
+    """
+    Return number of threads of xgboost in each of the workers so that the
+    total does not exceed cores.
+    """
+    return max(1, cores // workers)
+
+
+# state of sweep worker processes: shared tuning data
+_sweep = {}
+
+def _init_sweep_worker(description, n_splits=None, assignment=None):
+    block, data = attach_dataframe(description)
+    # folds of the worker, with the fold assignment of the main process
+    folds = CVFolds(data, n_splits=n_splits, assignment=assignment) if n_splits else None
+    _sweep.update(block=block, data=data, folds=folds)
+
+def _sweep_parameter(parameter, param_range, params, kwargs):
+    plt.switch_backend("Agg")
+    results = tune_parameter(_sweep["data"], parameter, param_range, estimator=xgb.XGBRegressor(**params),
+                             folds=_sweep["folds"], **kwargs)
+    plt.close("all")
+    return results
+
+
+def tune_parameters(data, parameters, params, workers=1, cores=None, folds=None, **kwargs):
+    """
+    Run the one parameter sweeps (tune_parameter) of parameters concurrently.
+    Input:
+        - data = dataset used for tuning, shared read only with the workers
+          (one copy in shared memory)
+        - parameters = dict of parameter: range
+        - params = parameters of the XGBRegressor tuned
+        - workers = number of sweeps running at the same time
+        - cores = cores divided between the workers, each sweep fitting
+          xgboost with cores // workers threads (all cores if None)
+        - folds = CVFolds of data. Each worker builds the fold matrices once
+          for all its sweeps, with the same fold assignment.
+    Returns dict of parameter: results.
+    """
+    cores = cores or os.cpu_count()
+    workers = max(1, min(workers, len(parameters)))
+    params = dict(params, n_jobs=split_cores(cores, workers))
+    print("Sweep workers\t:\t%d" %workers)
+    print("Threads/worker\t:\t%d" %params["n_jobs"])
+    if workers == 1:
+        return {parameter: tune_parameter(data, parameter, param_range, estimator=xgb.XGBRegressor(**params),
+                                          folds=folds, **kwargs)
+                for parameter, param_range in parameters.items()}
+    block, description = share_dataframe(data)
+    fold_args = (folds.n_splits, folds.assignment) if folds is not None else ()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker,
+                                 initargs=(description,) + fold_args) as pool:
+            futures = {parameter: pool.submit(_sweep_parameter, parameter, param_range, params, kwargs)
+                       for parameter, param_range in parameters.items()}
+            return {parameter: future.result() for parameter, future in futures.items()}
+    finally:
+        block.close()
+        block.unlink()
+
+
 def plot_fit(model,train_results=None, save=False, save_path=None):
     """
     Function to plot train and test(validation) results of a training or a model fitting
@@ -378,7 +696,16 @@ def plot_fit(model,train_results=None, save=False, save_path=None):
             fig.savefig("model_evolution.png")
 
 
-def tune_all(data, estimator, param_grid, n_iter=10,n_splits=5):
+def tune_all(data, estimator, param_grid, n_iter=10,n_splits=5, halving=False, folds=None, store=None):
+    if halving or folds is not None:
+        if halving:
+            grid_result = successive_halving(data, param_grid, base_params=estimator_params(estimator),
+                                             n_candidates=n_iter, n_splits=n_splits, store=store)
+        else:
+            grid_result = cv_search(folds, param_grid, base_params=estimator_params(estimator), n_candidates=n_iter,
+                                    store=store)
+        print("Best: %f using %s" % (grid_result.best_score_, grid_result.best_params_))
+        return grid_result
     train_x, train_y = cd.X_Y_split(data)
     kfold = KFold(n_splits=n_splits)
     param_search = RandomizedSearchCV(estimator,param_grid,n_iter=n_iter,
@@ -386,3 +713,9 @@ def tune_all(data, estimator, param_grid, n_iter=10,n_splits=5):
     grid_result = param_search.fit(train_x, train_y, verbose=0)
     print("Best: %f using %s" % (grid_result.best_score_, grid_result.best_params_))
     return grid_result
+
+def estimator_params(estimator):
+    """
+    Return parameters of an XGBRegressor for xgb.train, with n_estimators.
+    """
+    return dict(estimator.get_xgb_params(), n_estimators=estimator.get_params()["n_estimators"])
@@ -7,98 +7,144 @@ import numpy as np
 #from clean_dataframe import clean_dataframe
 from datafile import DataFile
 import datafile
+from snapshot_cache import read_snapshot
+from grid import GridIndex
+from dataset import DatasetWriter, CSVWriter
+from augmentation import add_data, Variant, sample_first_augmentation
+from augmentation import DIMENSIONLESS_COLUMNS
 import matplotlib.pyplot as plt
 import joblib, glob
 import sys, os, shutil
 from datetime import datetime
 import time
 
-# function to add dimensionless values to dataset
-def get_off_wall_point(dataframe, height=1):
-    grid_height = len(dataframe.groupby('Points:1'))
-    plane = grid_height**2
-    sorted_dataframe = dataframe.sort_values(["Points:1", "Points:2","Points:0"])
-    offWall_height = float(np.unique(sorted_dataframe.iloc[plane*height:plane*(height+1)]["Points:1"]))
-    offWall_velocity = np.mean(sorted_dataframe.iloc[plane*height:plane*(height+1)]["VELOC:0"])
-    return offWall_height, offWall_velocity
-
-def add_data(data,off_wall_height=1):
-    off_h, off_vel = get_off_wall_point(data, height=off_wall_height)
-    off_h, off_vel = get_off_wall_point(data, height=off_wall_height)
-    data['dim_y'] = data["Points:1"] / off_h
-    data['dim_delta'] = data['delta']/ off_h
-    data['dim_veloc'] = data["VELOC:0"] / off_vel
-    return data
-
-
-
-WORKING_FOLDER = os.getcwd()
-# get path to files
-try:
-    path = sys.argv[1]
-except:
-    print("Specify source location!")
-    sys.exit(1)
-
-if len(sys.argv) > 2:
-    sample_size = float(sys.argv[2])
-else:
-    sample_size = 0.1
-
-
-# get base_file to be modified
-file=path
-filename = os.path.split(file)[1]
-
-#get start time
-file_start_time = datetime.now()
-
-
-print("===========================================================\n")
-print("Basefile\t: \t%s" %filename)
-print("%d %% of each generated dataset will be sampled for final dataset! \n" %
-        (sample_size * 100))
-print("start time\t: \t%s\n" %file_start_time.strftime("%D - %H:%M:%S"))
-print("Opening basefile...\n")
-base_file = pd.read_csv(file)
-
-base_file['viscosity'] = 5.3566e-5
-#base_file['viscosity'] = 3.547e-4
-
-print("Making delta modifications...\n")
-old_delta = np.max(base_file['delta'])
-# delta ranges
-delta_range = [1e-1,2,5,1e1]
-new_deltas = []
-for delta in delta_range:
-    print("current delta : %d\n" %delta)
-    dataframe = datafile.modify_delta(base_file, old_delta, delta)
-    dataframe = add_data(dataframe)
-    new_deltas.append(dataframe)
-print("Delta modifications completed. Concatenating files...\n")
-complete_delta = pd.concat([i.sample(frac=sample_size) for i in new_deltas], ignore_index=True)
-
-print("Shape of complete delta dataset is %d %d\n" %(complete_delta.shape))
-
-print("Making viscosity modifications...\n")
-old_viscosity = base_file.viscosity[0]
-# viscosity ranges
-viscosity_range = [1e-5,1e-3,1e1,1e4]
-new_viscos = []
-for visco in viscosity_range:
-    print("current viscosity : %d\n" %visco)
-    dataframe = datafile.modify_viscosity(base_file, old_viscosity, visco)
-    dataframe = add_data(dataframe)
-    new_viscos.append(dataframe)
-print("Viscosity modifications completed. Concatenating files...\n")
-complete_visco = pd.concat([i.sample(frac=sample_size) for i in new_viscos], ignore_index=True)
-print("Shape of complete viscosity dataset is %d %d\n" %(complete_visco.shape))
-
-print("Concatenating all files to make final dataset...\n")
-complete_file = pd.concat([base_file.sample(frac=0.2),complete_visco, complete_delta], ignore_index=True)
-
-print("Shape of complete dataset is %d %d\n" %(complete_file.shape))
-
-print("Saving complete dataset...\n")
-
-complete_file.to_csv("train_complete_1000.csv",  header=True, index=False)
+# the variants are generated in worker processes, which import this script when
+# started with spawn (macOS, Linux from python 3.14)
+if __name__ == "__main__":
+    WORKING_FOLDER = os.getcwd()
+    # get path to files
+    try:
+        path = sys.argv[1]
+    except:
+        print("Specify source location!")
+        sys.exit(1)
+
+    if len(sys.argv) > 2:
+        sample_size = float(sys.argv[2])
+    else:
+        sample_size = 0.1
+
+    # output dataset (memory mapped dataset directory, or csv file if name ends with .csv)
+    if len(sys.argv) > 3:
+        output = sys.argv[3]
+    else:
+        output = "train_complete_1000"
+    # fraction of the base file kept in the final dataset
+    base_sample_size = 0.2
+
+    # mode: "sample" draws the samples first and modifies only the sampled rows,
+    # "full" modifies the complete base file for each variant before sampling
+    if len(sys.argv) > 4:
+        mode = sys.argv[4]
+    else:
+        mode = "sample"
+    # seed for drawing the samples (sample mode), fixed so that the dataset can be
+    # generated again
+    if len(sys.argv) > 5:
+        seed = int(sys.argv[5])
+    else:
+        seed = 0
+    # number of processes generating the variants (sample mode)
+    if len(sys.argv) > 6:
+        workers = int(sys.argv[6])
+    else:
+        workers = 1
+
+
+    # get base_file to be modified
+    file=path
+    filename = os.path.split(file)[1]
+
+    #get start time
+    file_start_time = datetime.now()
+
+
+    print("===========================================================\n")
+    print("Basefile\t: \t%s" %filename)
+    print("%d %% of each generated dataset will be sampled for final dataset! \n" %
+            (sample_size * 100))
+    print("start time\t: \t%s\n" %file_start_time.strftime("%D - %H:%M:%S"))
+    print("Opening basefile...\n")
+    # in sample mode the cached snapshot is memory mapped, only sampled rows are loaded
+    base_file = read_snapshot(file, mmap=(mode == "sample"))
+
+    base_file['viscosity'] = 5.3566e-5
+    #base_file['viscosity'] = 3.547e-4
+
+    old_delta = np.max(base_file['delta'])
+    old_viscosity = base_file.viscosity[0]
+    # delta ranges
+    delta_range = [1e-1,2,5,1e1]
+    # viscosity ranges
+    viscosity_range = [1e-5,1e-3,1e1,1e4]
+
+    if mode == "sample":
+        print("Sampling base file and modifying sampled rows for each delta and viscosity...\n")
+        # blocks in the same order as in full mode: base sample, viscosities, deltas
+        variants = [Variant(base_sample_size, dimensionless=False)]
+        variants += [Variant(sample_size, viscosity=visco) for visco in viscosity_range]
+        variants += [Variant(sample_size, delta=delta) for delta in delta_range]
+        if output.endswith(".csv"):
+            writer = CSVWriter(output, columns=list(base_file.columns) + DIMENSIONLESS_COLUMNS)
+        else:
+            writer = DatasetWriter(output)
+        print("Saving complete dataset to %s...\n" %output)
+        n_rows = sample_first_augmentation(base_file, variants, writer, filename, seed=seed, workers=workers)
+        writer.close()
+        print("\nShape of complete dataset is %d %d\n" %(n_rows, len(base_file.columns) + len(DIMENSIONLESS_COLUMNS)))
+    else:
+        print("Making delta and viscosity modifications...\n")
+        variants = datafile.augment(base_file, old_delta, old_viscosity, new_deltas=delta_range,
+                                    new_viscosities=viscosity_range)
+        variants = datafile.split_variants(variants, len(base_file))
+        # grid layout is the same for all variants, compute it once
+        grid = GridIndex.from_dataframe(base_file)
+
+        new_deltas = []
+        for delta, dataframe in zip(delta_range, variants[:len(delta_range)]):
+            print("current delta : %d\n" %delta)
+            dataframe = add_data(dataframe, grid=grid)
+            new_deltas.append(dataframe)
+        print("Delta modifications completed. Sampling files...\n")
+        delta_samples = [i.sample(frac=sample_size) for i in new_deltas]
+
+        print("Shape of complete delta dataset is %d %d\n" %(sum(map(len, delta_samples)), new_deltas[0].shape[1]))
+
+        new_viscos = []
+        for visco, dataframe in zip(viscosity_range, variants[len(delta_range):]):
+            print("current viscosity : %d\n" %visco)
+            dataframe = add_data(dataframe, grid=grid)
+            new_viscos.append(dataframe)
+        print("Viscosity modifications completed. Sampling files...\n")
+        visco_samples = [i.sample(frac=sample_size) for i in new_viscos]
+        print("Shape of complete viscosity dataset is %d %d\n" %(sum(map(len, visco_samples)), new_deltas[0].shape[1]))
+
+        base_sample = base_file.sample(frac=base_sample_size)
+        n_rows = len(base_sample) + sum(map(len, visco_samples)) + sum(map(len, delta_samples))
+        print("Shape of complete dataset is %d %d\n" %(n_rows, new_deltas[0].shape[1]))
+
+        print("Saving complete dataset to %s...\n" %output)
+
+        if output.endswith(".csv"):
+            complete_file = pd.concat([base_sample] + visco_samples + delta_samples, ignore_index=True)
+            complete_file.to_csv(output,  header=True, index=False)
+        else:
+            # write each sample as a block of the memory mapped dataset
+            writer = DatasetWriter(output)
+            writer.append(base_sample, source=filename, delta=old_delta, viscosity=old_viscosity,
+                          sample_size=base_sample_size)
+            for visco, sample in zip(viscosity_range, visco_samples):
+                writer.append(sample, source=filename, delta=old_delta, viscosity=visco, sample_size=sample_size)
+            for delta, sample in zip(delta_range, delta_samples):
+                writer.append(sample, source=filename, delta=delta, viscosity=old_viscosity, sample_size=sample_size)
+            writer.close()
@@ -0,0 +1,173 @@
+"""
+Structured grid index for snapshots of the channel flow.
+The plane layout of a snapshot (unique y levels, position of each row on the
+grid and the rows of every y plane) is computed once, so that off wall points,
+plane means and half channel selections do not need to sort the dataframe.
+Fields can also be held as dense (ny, nx, nz) arrays (DenseFields).
+"""
+
+#import libraries
+import numpy as np
+import pandas as pd
+
+### ---------- GLOBAL VARIABLES -----------------###
+# coordinates of grid points in snapshots (x, y (wall normal), z)
+COORDINATES = ['Points:0', 'Points:1', 'Points:2']
+
+
+class GridIndex(object):
+    """
+    Index of the structured grid of a snapshot.
+    Attributes:
+        - y_levels = sorted unique wall normal coordinates
+        - shape = (ny, nx, nz)
+        - i, j, k = index of each row along x, y and z
+        - order = row positions sorted by y plane, then z, then x
+        - offsets = start of each y plane in order (length ny + 1)
+    Rows are referred to by position, so the index can be reused for any
+    dataframe with the same row order, e.g. the variants generated by
+    datafile.augment (modifications only rescale the wall normal coordinate).
+    """
+    def __init__(self, x, y, z):
+        x_levels, self.i = np.unique(x, return_inverse=True)
+        self.y_levels, self.j = np.unique(y, return_inverse=True)
+        z_levels, self.k = np.unique(z, return_inverse=True)
+        self.shape = (len(self.y_levels), len(x_levels), len(z_levels))
+        self.order = np.lexsort((self.i, self.k, self.j))
+        self.counts = np.bincount(self.j, minlength=self.shape[0])
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+    @classmethod
+    def from_dataframe(cls, dataframe):
+        x, y, z = [dataframe[coordinate].values for coordinate in COORDINATES]
+        return cls(x, y, z)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __repr__(self):
+        return "GridIndex(ny=%d, nx=%d, nz=%d, rows=%d)" % (self.shape + (len(self),))
+
+    @property
+    def is_complete(self):
+        """
+        True if every point of the grid appears exactly once.
+        """
+        return len(self) == np.prod(self.shape) and bool(np.all(self.counts == self.counts[0]))
+
+    def plane_rows(self, height):
+        """
+        Return row positions of y plane number height (0 at the lower wall),
+        sorted by z then x.
+        """
+        return self.order[self.offsets[height]:self.offsets[height + 1]]
+
+    def off_wall_point(self, dataframe, height=1):
+        """
+        Return wall normal coordinate and mean streamwise velocity of y plane
+        number height of dataframe.
+        """
+        rows = self.plane_rows(height)
+        off_wall_height = float(dataframe["Points:1"].values[rows[0]])
+        off_wall_velocity = np.mean(dataframe["VELOC:0"].values[rows])
+        return off_wall_height, off_wall_velocity
+
+    def plane_means(self, values):
+        """
+        Return mean of values (one per row) over each y plane, ordered by y.
+        """
+        values = np.asarray(values, dtype=float)
+        return np.bincount(self.j, weights=values, minlength=self.shape[0]) / self.counts
+
+    def half_channel_rows(self):
+        """
+        Return row positions of the lower half of the channel.
+        """
+        return self.order[:self.offsets[self.shape[0] // 2]]
+
+    def to_dense(self, values):
+        """
+        Return (ny, nx, nz) array of values given one value per row.
+        """
+        values = np.asarray(values)
+        dense = np.empty(self.shape, dtype=values.dtype)
+        dense[self.j, self.i, self.k] = values
+        return dense
+
+    def from_dense(self, dense):
+        """
+        Return one value per row (in row order) from a (ny, nx, nz) array.
+        """
+        return dense[self.j, self.i, self.k]
+
+
+class DenseFields(object):
+    """
+    Dense representation of a snapshot: one contiguous (ny, nx, nz) array per
+    column, with y as first axis so that y planes are contiguous.
+    Wall normal statistics become reductions over the x and z axes.
+    Requires a complete structured grid (each grid point exactly once).
+    """
+    def __init__(self, grid, fields, index=None):
+        assert grid.is_complete, "dense fields require a complete structured grid"
+        self.grid = grid
+        self.fields = fields
+        self.index = index
+
+    @classmethod
+    def from_dataframe(cls, dataframe, columns=None, grid=None):
+        """
+        Build dense fields of columns (all columns if None) of dataframe.
+        """
+        if grid is None:
+            grid = GridIndex.from_dataframe(dataframe)
+        if columns is None:
+            columns = list(dataframe.columns)
+        fields = {column: grid.to_dense(dataframe[column].values) for column in columns}
+        return cls(grid, fields, index=dataframe.index)
+
+    def to_dataframe(self, columns=None):
+        """
+        Return fields as a dataframe with one row per grid point, in the row
+        order of the dataframe the fields were built from.
+        """
+        if columns is None:
+            columns = list(self.fields)
+        data = {column: self.grid.from_dense(self.fields[column]) for column in columns}
+        return pd.DataFrame(data, columns=columns, index=self.index)
+
+    def __getitem__(self, column):
+        return self.fields[column]
+
+    def __contains__(self, column):
+        return column in self.fields
+
+    def __repr__(self):
+        return "DenseFields(shape=%s, columns=%s)" % (self.grid.shape, list(self.fields))
+
+    @property
+    def columns(self):
+        return list(self.fields)
+
+    def plane_means(self, column):
+        """
+        Return mean of column over each y plane, ordered by y.
+        """
+        return self.fields[column].mean(axis=(1, 2))
+
+    def fold(self, column):
+        """
+        Return column folded about the channel centre: average of each plane
+        of the lower half with its mirror plane of the upper half, shape
+        (ny//2, nx, nz), ordered from the wall.
+        """
+        field = self.fields[column]
+        half = self.grid.shape[0] // 2
+        return 0.5 * (field[:half] + field[::-1][:half])
+
+    def off_wall_point(self, height=1):
+        """
+        Return wall normal coordinate and mean streamwise velocity of y plane
+        number height.
+        """
+        return float(self.fields["Points:1"][height, 0, 0]), self.fields["VELOC:0"][height].mean()
@@ -0,0 +1,366 @@
+"""
+Local inference server for the u_plus models, queried by running simulations.
+Models of the MODELS folder (joblib models, .json boosters and .npz compiled
+forests, indexed by registry.ModelRegistry and named as in it) are loaded on
+their first request and kept in memory up to max_memory, least recently used
+dropped first; the best models are loaded at start. Requests are json lines
+sent over a Unix socket or a localhost port:
+    {"id": 1, "model": "<name>", "data": {"<raw snapshot column>": [values]}}
+answered with {"id": 1, "predictions": [values]} (or {"id": 1, "error": msg}).
+The features of the model are computed from the raw columns on the server as
+in clean_dataframe. Concurrent requests for the same model are merged into
+one batch, waiting at most max_delay after the first request of the batch.
+{"models": true} returns the names of the models and the raw columns needed
+by each model in memory, and {"stats": true} returns the number of requests, throughput and latency
+percentiles, also printed every REPORT_EVERY seconds.
+usage: python inference_server.py [models folder] [socket path | port] [max_delay (ms)] [max_batch_rows]
+    [models loaded at start] [max_memory (MB)]
+"""
+
+#import libraries
+import os, sys, json, time, socket, asyncio
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import clean_dataframe as cd
+from registry import ModelRegistry, MAX_MEMORY
+
+### ---------- GLOBAL VARIABLES -----------------###
+MODELS = os.getcwd() + "/MODELS"
+SOCKET_PATH = "inference.sock"
+# longest time a request waits for other requests to join its batch (seconds)
+MAX_DELAY = 0.002
+MAX_BATCH_ROWS = 100000
+# models loaded at start (best RMSE first)
+WARM_UP_MODELS = 8
+# latencies kept for the percentiles
+LATENCY_WINDOW = 100000
+REPORT_EVERY = 60
+# features of models without feature names (as X_Y_split)
+MODEL_FEATURES = [column for column in cd.REQUIRED_COLUMNS if column not in cd.TO_PREDICT + ["y_plus"]]
+# lines of large requests (bytes)
+LINE_LIMIT = 2 ** 28
+
+
+def load_models(folder=MODELS, max_memory=MAX_MEMORY):
+    """
+    Return ModelRegistry of the models found in folder and its subfolders.
+    No model is loaded: models are loaded on first use and kept up to
+    max_memory (bytes).
+    """
+    registry = ModelRegistry(folder, max_memory=max_memory)
+    assert len(registry), "no models found in %s" %folder
+    return registry
+
+
+def model_features(model):
+    """
+    Return feature names of a model, MODEL_FEATURES if it has none.
+    """
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    return list(getattr(booster, "feature_names", None) or MODEL_FEATURES)
+
+
+def features(model, data):
+    """
+    Return float features of model computed from raw snapshot columns data
+    (KeyError for missing columns, ValueError for non numeric values).
+    """
+    return cd.compute_features(data, model_features(model)).astype(np.float64)
+
+
+def predict_features(model, x):
+    if isinstance(model, xgb.Booster):
+        return model.predict(xgb.DMatrix(x))
+    return model.predict(x)
+
+
+def predict(model, data):
+    """
+    Return predictions of model on raw snapshot columns data.
+    """
+    return predict_features(model, features(model, data))
+
+
+class ServerStats(object):
+    """
+    Counts of requests, rows and batches, with latency of recent requests.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def add_batch(self, requests, rows):
+        self.batches += 1
+        self.requests += requests
+        self.rows += rows
+
+    def add_latency(self, latency):
+        self.latencies.append(latency)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        report = dict(requests=self.requests, rows=self.rows, batches=self.batches, errors=self.errors,
+                      requests_per_second=self.requests / elapsed, rows_per_second=self.rows / elapsed,
+                      mean_batch_requests=self.requests / float(self.batches) if self.batches else 0.0)
+        latencies = np.asarray(self.latencies) * 1000
+        for percentile in [50, 90, 99]:
+            report["latency_p%d_ms" %percentile] = float(np.percentile(latencies, percentile)) if len(latencies) else None
+        return report
+
+
+class ModelBatcher(object):
+    """
+    Queue of the requests of one model, predicted in micro batches: a batch
+    is closed max_delay after its first request or at max_rows rows.
+    Predictions run in executor, outside of the event loop, with the model
+    returned by get_model (called for each batch, so that the batcher does
+    not keep a model dropped from memory).
+    """
+    def __init__(self, get_model, executor, stats, max_delay=MAX_DELAY, max_rows=MAX_BATCH_ROWS):
+        self.get_model = get_model
+        self.executor = executor
+        self.stats = stats
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.queue = asyncio.Queue()
+
+    async def predict(self, x, arrival):
+        """
+        Return predictions of features x (see features) of a request read at
+        arrival (perf_counter), once its batch is predicted.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((x, future, arrival))
+        return await future
+
+    async def next_batch(self):
+        batch = [await self.queue.get()]
+        rows = len(batch[0][0])
+        deadline = batch[0][2] + self.max_delay
+        while rows < self.max_rows:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self.queue.get_nowait() if timeout <= 0 else \
+                    await asyncio.wait_for(self.queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(request)
+            rows += len(request[0])
+        return batch, rows
+
+    def predict_batch(self, frames):
+        return predict_features(self.get_model(), pd.concat(frames, ignore_index=True))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch, rows = await self.next_batch()
+            frames = [data for data, _, _ in batch]
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.predict_batch, frames)
+            except Exception as exc:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            ends = np.cumsum([len(data) for data in frames])
+            start = 0
+            for (_, future, _), end in zip(batch, ends):
+                # requests of closed connections are cancelled
+                if not future.done():
+                    future.set_result(predictions[start:end])
+                start = end
+            self.stats.add_batch(len(batch), rows)
+
+
+class InferenceServer(object):
+    """
+    Server of models (ModelRegistry, or dict of name: model) on address (Unix
+    socket path or localhost port).
+    Models are only used in the executor thread (the registry loads and drops
+    them), one batcher is started for each model on its first request.
+    """
+    def __init__(self, models, address=SOCKET_PATH, max_delay=MAX_DELAY, max_rows=MAX_BATCH_ROWS):
+        self.models = models
+        self.address = address
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.stats = ServerStats()
+        # one prediction at a time, each using all the threads of xgboost
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batchers = {}
+        # references to the running tasks (the event loop keeps weak ones)
+        self.tasks = []
+
+    def names(self):
+        return list(self.models.entries) if isinstance(self.models, ModelRegistry) else list(self.models)
+
+    def loaded_models(self):
+        return dict(self.models.models) if isinstance(self.models, ModelRegistry) else self.models
+
+    def warm_up(self, n=WARM_UP_MODELS):
+        """
+        Load the n best models (first n of a dict) and predict one row with
+        each, so that their first requests do not pay for the loading and
+        the set up of the predictors. Models that fail to load are skipped,
+        their requests are answered with the error.
+        """
+        names = self.models.best(n) if isinstance(self.models, ModelRegistry) else self.names()[:n]
+        for name in names:
+            try:
+                model = self.models.get(name)
+            except Exception as exc:
+                print("Skipping %s: %s: %s" %(name, type(exc).__name__, exc))
+                continue
+            predict(model, pd.DataFrame({column: [1.0] for column in cd.input_columns(model_features(model))
+                                         if column != "viscosity"}))
+
+    def batcher(self, name):
+        if name not in self.batchers:
+            self.batchers[name] = ModelBatcher(partial(self.models.get, name), self.executor, self.stats,
+                                               self.max_delay, self.max_rows)
+            self.tasks.append(asyncio.ensure_future(self.batchers[name].run()))
+        return self.batchers[name]
+
+    def request_features(self, name, data):
+        return features(self.models.get(name), pd.DataFrame(data))
+
+    def model_columns(self):
+        # raw columns to send for each model in memory
+        return {name: cd.input_columns(model_features(model)) for name, model in self.loaded_models().items()}
+
+    async def answer(self, request, arrival):
+        if request.get("stats"):
+            return dict(stats=self.stats.report())
+        loop = asyncio.get_running_loop()
+        if request.get("models"):
+            return dict(names=self.names(), models=await loop.run_in_executor(self.executor, self.model_columns))
+        name = request.get("model")
+        if name is None and len(self.models) == 1:
+            name = self.names()[0]
+        if name not in self.models:
+            raise KeyError("unknown model %s" %name)
+        # checked before queuing, so that a bad request (or a model failing to
+        # load) fails alone and not the batch it would join. Computed in the
+        # executor, not to hold the other connections
+        x = await loop.run_in_executor(self.executor, self.request_features, name, request["data"])
+        predictions = await self.batcher(name).predict(x, arrival)
+        return dict(predictions=np.asarray(predictions, dtype=float).tolist())
+
+    async def handle(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            # latency of a request: from reading its line to writing its
+            # response
+            arrival = time.perf_counter()
+            request = {}
+            try:
+                parsed = json.loads(line)
+                assert isinstance(parsed, dict), "requests should be json objects"
+                request = parsed
+                response = await self.answer(request, arrival)
+            except Exception as exc:
+                if "data" in request:
+                    self.stats.errors += 1
+                response = dict(error="%s: %s" %(type(exc).__name__, exc))
+            if "id" in request:
+                response["id"] = request["id"]
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+            if "predictions" in response:
+                self.stats.add_latency(time.perf_counter() - arrival)
+        writer.close()
+
+    async def report(self, every=REPORT_EVERY):
+        requests = 0
+        while True:
+            await asyncio.sleep(every)
+            if self.stats.requests != requests:
+                requests = self.stats.requests
+                print(json.dumps(self.stats.report()))
+
+    async def start(self):
+        """
+        Start listening, returning the asyncio server.
+        """
+        if isinstance(self.address, int):
+            return await asyncio.start_server(self.handle, "127.0.0.1", self.address, limit=LINE_LIMIT)
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        return await asyncio.start_unix_server(self.handle, self.address, limit=LINE_LIMIT)
+
+    async def serve(self):
+        server = await self.start()
+        self.tasks.append(asyncio.ensure_future(self.report()))
+        print("Serving %d models on %s" %(len(self.models), self.address))
+        async with server:
+            await server.serve_forever()
+
+
+class InferenceClient(object):
+    """
+    Blocking client of an InferenceServer, for use in simulations.
+    """
+    def __init__(self, address=SOCKET_PATH):
+        if isinstance(address, int):
+            self.socket = socket.create_connection(("127.0.0.1", address))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(address)
+        self.file = self.socket.makefile("rwb")
+
+    def request(self, request):
+        self.file.write(json.dumps(request).encode() + b"\n")
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def predict(self, data, model=None):
+        """
+        Return predictions of model on data (dataframe or dict of raw snapshot
+        columns).
+        """
+        if isinstance(data, pd.DataFrame):
+            data = {column: data[column].tolist() for column in data.columns}
+        return np.asarray(self.request(dict(model=model, data=data))["predictions"])
+
+    def stats(self):
+        return self.request(dict(stats=True))["stats"]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+def parse_address(address):
+    return int(address) if address.isdigit() else address
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else MODELS
+    address = parse_address(sys.argv[2]) if len(sys.argv) > 2 else SOCKET_PATH
+    max_delay = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else MAX_DELAY
+    max_rows = int(sys.argv[4]) if len(sys.argv) > 4 else MAX_BATCH_ROWS
+    warm_up = int(sys.argv[5]) if len(sys.argv) > 5 else WARM_UP_MODELS
+    max_memory = float(sys.argv[6]) * 1e6 if len(sys.argv) > 6 else MAX_MEMORY
+
+    print("Indexing models of %s..." %folder)
+    server = InferenceServer(load_models(folder, max_memory), address, max_delay=max_delay, max_rows=max_rows)
+    server.warm_up(warm_up)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats.report()))
@@ -0,0 +1,180 @@
+"""
+Learning curve of xgboost models: validation RMSE against the fraction of the
+training data used.
+Subsets are nested (each larger subset contains the smaller ones) and all
+sizes are evaluated on the same validation data. Sizes are trained in
+parallel worker processes sharing a core budget, each size in a new process
+so that its peak memory can be recorded with its wall time and RMSE.
+"""
+
+#import libraries
+import os, sys, time, resource
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import xgboost as xgb
+from multiprocessing import get_context
+from sklearn.model_selection import train_test_split
+from clean_dataframe import X_Y_split
+from augmentation import share_dataframe, attach_dataframe
+from functions import plot_fit, split_cores
+from registry import save_model
+
+### ---------- GLOBAL VARIABLES -----------------###
+TABLE_COLUMNS = ["fraction", "rows", "wall_time", "peak_memory", "train_rmse", "validation_rmse", "best_iteration"]
+
+
+def nested_subsets(n_rows, fractions, seed=0):
+    """
+    Return rows of the subset of each fraction: the first rows of one
+    permutation, so that each subset contains the smaller ones.
+    """
+    order = np.random.RandomState(seed).permutation(n_rows)
+    return {fraction: np.sort(order[:int(round(fraction * n_rows))]) for fraction in fractions}
+
+
+def peak_memory():
+    """
+    Return peak resident memory (MB) of the current process.
+    On linux, peak of the memory of the process image (VmHWM), which starts
+    again at exec. ru_maxrss is kept across exec, so a spawned process would
+    report the peak of the process starting it.
+    """
+    if os.path.isfile("/proc/self/status"):
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1e3
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def train_subset(train_data, validation_data, rows, params, n_estimators=20, save_path=None):
+    """
+    Train model on rows of train_data, evaluated on validation_data.
+    Saves model, evaluation results and training plot in save_path if given.
+    Returns dict of the results of the subset (see TABLE_COLUMNS).
+    """
+    start_time = time.time()
+    train_x, train_y = X_Y_split(train_data.iloc[rows])
+    validation_x, validation_y = X_Y_split(validation_data)
+    model = xgb.XGBRegressor(**dict(params, n_estimators=n_estimators, eval_metric="rmse", early_stopping_rounds=50))
+    model.fit(train_x, train_y, eval_set=[(train_x, train_y), (validation_x, validation_y)], verbose=False)
+    wall_time = time.time() - start_time
+    results = model.evals_result()
+    validation_rmse = results["validation_1"]["rmse"]
+    best = int(np.argmin(validation_rmse))
+    if save_path:
+        plot_fit(model, save=True, save_path=save_path)
+        plt.close("all")
+        subset_name = save_path.rstrip("/").split("/")[-1]
+        save_model(model, save_path + "/%s.mdl" %subset_name, results=results,
+                   results_path=save_path + "/results_%s.rsl" %subset_name,
+                   source="%d training rows" %len(rows), train_time=wall_time)
+    return dict(rows=len(rows), wall_time=wall_time, peak_memory=peak_memory(),
+                train_rmse=results["validation_0"]["rmse"][best],
+                validation_rmse=validation_rmse[best], best_iteration=best)
+
+
+# state of worker processes: shared train and validation data
+_worker = {}
+
+def _init_worker(train_description, validation_description):
+    train_block, train_data = attach_dataframe(train_description)
+    validation_block, validation_data = attach_dataframe(validation_description)
+    _worker.update(blocks=(train_block, validation_block), train_data=train_data, validation_data=validation_data)
+
+def _worker_train_subset(args):
+    fraction, rows, params, n_estimators, save_path = args
+    plt.switch_backend("Agg")
+    results = train_subset(_worker["train_data"], _worker["validation_data"], rows, params,
+                           n_estimators=n_estimators, save_path=save_path)
+    results["fraction"] = fraction
+    return results
+
+
+def learning_curve(data, fractions, params, workers=1, cores=None, n_estimators=20, test_size=0.3, seed=0,
+                   save_path=None):
+    """
+    Train a model on nested subsets of data and return table of the results
+    of each fraction (see TABLE_COLUMNS, peak memory in MB).
+    Input:
+        - data = clean dataset, split once into training data (subsets) and
+          validation data (same for all sizes)
+        - fractions = fractions of the training data
+        - workers = number of sizes trained at the same time, each fitting
+          xgboost with cores // workers threads (all cores if None)
+        - save_path = folder where the model of each fraction is saved in
+          subset_<fraction>
+    """
+    cores = cores or os.cpu_count()
+    workers = max(1, min(workers, len(fractions)))
+    params = dict(params, n_jobs=split_cores(cores, workers))
+    train_data, validation_data = train_test_split(data, test_size=test_size, random_state=seed)
+    subsets = nested_subsets(len(train_data), fractions, seed=seed)
+    tasks = []
+    for fraction in fractions:
+        subset_path = None
+        if save_path:
+            subset_path = save_path + "/subset_%s" %fraction
+            if not os.path.isdir(subset_path):
+                os.mkdir(subset_path)
+        tasks.append((fraction, subsets[fraction], params, n_estimators, subset_path))
+
+    train_block, train_description = share_dataframe(train_data)
+    validation_block, validation_description = share_dataframe(validation_data)
+    try:
+        # one new process per size, so that peak memory is measured per size.
+        # Spawned rather than forked: a forked process starts with the peak
+        # memory of this process (holding the whole dataset). On error the
+        # workers are terminated before the shared data is unlinked
+        with get_context("spawn").Pool(processes=workers, initializer=_init_worker,
+                                       initargs=(train_description, validation_description),
+                                       maxtasksperchild=1) as pool:
+            table = []
+            for results in pool.imap_unordered(_worker_train_subset, tasks):
+                print("fraction %s\t:\t%d rows, RMSE %f in %.1f s, %.0f MB" %(results["fraction"], results["rows"],
+                      results["validation_rmse"], results["wall_time"], results["peak_memory"]))
+                table.append(results)
+            pool.close()
+            pool.join()
+    finally:
+        for block in [train_block, validation_block]:
+            block.close()
+            block.unlink()
+    return pd.DataFrame(table, columns=TABLE_COLUMNS).sort_values("fraction").reset_index(drop=True)
+
+
+def smallest_fraction(table, tolerance=0.01):
+    """
+    Return smallest fraction with validation RMSE within tolerance (relative)
+    of the best RMSE of the table.
+    """
+    target = table.validation_rmse.min() * (1 + tolerance)
+    return table.fraction[table.validation_rmse <= target].min()
+
+
+def plot_learning_curve(table, save=False, save_path=None):
+    """
+    Plot validation and train RMSE against fraction of training data, with
+    wall time of each fraction.
+    """
+    fig, ax = plt.subplots()
+    ax.plot(table.fraction, table.train_rmse, marker="o", label="Train", c="b")
+    ax.plot(table.fraction, table.validation_rmse, marker="o", label="Validation", c="r")
+    ax.set_xscale("log")
+    ax.set_xlabel("Fraction of training data")
+    ax.set_ylabel("RMSE")
+    ax.set_title("Learning curve")
+    ax.legend(loc="upper center")
+    time_ax = ax.twinx()
+    time_ax.plot(table.fraction, table.wall_time, linestyle="--", marker="x", c="grey")
+    time_ax.set_ylabel("Wall time (s)")
+    fig.tight_layout()
+    if save:
+        if save_path:
+            fig.savefig("%s/learning_curve.png" %save_path)
+        else:
+            fig.savefig("learning_curve.png")
+    return fig
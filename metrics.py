@@ -0,0 +1,137 @@
+"""
+Running accumulators for scoring predictions chunk by chunk.
+Error metrics are accumulated with the mean / sum of squares merge of Chan et
+al. (Welford for batches), so that the result of several chunks is the same
+as for the whole data up to rounding, without keeping the errors. A single
+array is scored in one vectorized pass (one chunk).
+Profiles accumulate sums per y plane, giving the mean of columns over each
+plane (as functions.return_average) in one pass over the chunks.
+"""
+
+#import libraries
+import numpy as np
+
+### ---------- GLOBAL VARIABLES -----------------###
+# bands of y+ of the errors per band: viscous sublayer, buffer layer, log law
+# region and outer layer
+BANDS = ["viscous", "buffer", "log", "outer"]
+BAND_EDGES = [0, 5, 30, 300, np.inf]
+BAND_METRICS = ["n", "rmse", "mae", "max_error"]
+
+
+class ErrorMetrics(object):
+    """
+    Accumulator of the errors of predictions against actual values, overall
+    and in bands of y+ (BANDS, bands without rows are left out of results).
+    """
+    def __init__(self, bands=BANDS):
+        self.n = 0
+        # mean and sum of squared deviations of actual values (for R2)
+        self.mean_actual = 0.0
+        self.m2_actual = 0.0
+        # means of errors, absolute errors and squared errors
+        self.mean_error = 0.0
+        self.mean_abs_error = 0.0
+        self.mean_squared_error = 0.0
+        self.max_error = 0.0
+        self.bands = bands
+        self.band_metrics = {name: ErrorMetrics(bands=None) for name in bands or {}}
+
+    @classmethod
+    def from_arrays(cls, actual, error):
+        """
+        Return accumulator (without bands) of float arrays of actual values and
+        errors, computed in one vectorized pass.
+        """
+        metrics = cls(bands=None)
+        metrics.n = len(actual)
+        if metrics.n:
+            abs_error = np.abs(error)
+            metrics.mean_actual = actual.mean()
+            metrics.m2_actual = np.square(actual - metrics.mean_actual).sum()
+            metrics.mean_error = error.mean()
+            metrics.mean_abs_error = abs_error.mean()
+            metrics.mean_squared_error = np.square(error).mean()
+            metrics.max_error = abs_error.max()
+        return metrics
+
+    def merge(self, other):
+        """
+        Add the values of accumulator other (Chan et al. update of the means
+        and sum of squares).
+        """
+        n = self.n + other.n
+        if not other.n:
+            return self
+        weight = float(other.n) / n
+        delta = other.mean_actual - self.mean_actual
+        self.m2_actual += other.m2_actual + delta ** 2 * self.n * weight
+        self.mean_actual += delta * weight
+        self.mean_error += (other.mean_error - self.mean_error) * weight
+        self.mean_abs_error += (other.mean_abs_error - self.mean_abs_error) * weight
+        self.mean_squared_error += (other.mean_squared_error - self.mean_squared_error) * weight
+        self.max_error = max(self.max_error, other.max_error)
+        self.n = n
+        for name, metrics in other.band_metrics.items():
+            self.band_metrics[name].merge(metrics)
+        return self
+
+    def update(self, actual, predicted, y_plus=None):
+        """
+        Add actual and predicted values of a chunk (with y+ of its rows for the
+        errors per band).
+        """
+        actual = np.asarray(actual, dtype=np.float64).ravel()
+        error = actual - np.asarray(predicted, dtype=np.float64).ravel()
+        self.merge(ErrorMetrics.from_arrays(actual, error))
+        if self.bands and y_plus is not None:
+            band = np.digitize(np.asarray(y_plus, dtype=np.float64).ravel(), BAND_EDGES[1:-1])
+            for index, name in enumerate(self.bands):
+                rows = band == index
+                self.band_metrics[name].merge(ErrorMetrics.from_arrays(actual[rows], error[rows]))
+        return self
+
+    def results(self):
+        """
+        Return dict of metrics, with rmse, mae, max_error and n of each band
+        as <metric>_<band>.
+        """
+        r2 = 1 - self.mean_squared_error * self.n / self.m2_actual if self.m2_actual else np.nan
+        results = dict(n=self.n,
+                       rmse=float(np.sqrt(self.mean_squared_error)),
+                       mse=float(self.mean_squared_error),
+                       mae=float(self.mean_abs_error),
+                       r2=float(r2),
+                       max_error=float(self.max_error),
+                       mean_error=float(self.mean_error))
+        for name, metrics in self.band_metrics.items():
+            if metrics.n:
+                band = metrics.results()
+                for metric in BAND_METRICS:
+                    results["%s_%s" %(metric, name)] = band[metric]
+        return results
+
+
+class PlaneProfile(object):
+    """
+    Accumulator of sums of columns over each y plane (key column).
+    """
+    def __init__(self, columns, key="Points:1"):
+        self.columns = list(columns)
+        self.key = key
+        self.sums = None
+
+    def update(self, dataframe):
+        sums = dataframe.groupby(self.key)[self.columns].agg("sum")
+        sums["count"] = dataframe.groupby(self.key).size()
+        self.sums = sums if self.sums is None else self.sums.add(sums, fill_value=0)
+        return self
+
+    def means(self):
+        """
+        Return dataframe of mean of columns over each plane, ordered by the
+        key column (one row per plane, key as a column).
+        """
+        means = self.sums[self.columns].div(self.sums["count"], axis=0).sort_index()
+        means.index.name = self.key
+        return means.reset_index()
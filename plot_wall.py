@@ -11,17 +11,13 @@ def plot_wall(dataframe, title):
     if 'Points.1' in dataframe.columns:
         dataframe.rename(columns={'Points.1':'Points:1'}, inplace=True)
     dataframe = dataframe.sort_values(['Points:1'])
-    y_set = sorted(list(set(dataframe['Points:1'])))
-    # calculate averages for each delta
-    for idx, y in enumerate(y_set):
-        dataframe.loc[dataframe['Points:1'] == y_set[idx], 'avg_uplus_orig']= dataframe.loc[dataframe['Points:1'] == y_set[idx], 'u_plus'].mean(axis=0)
-        dataframe.loc[dataframe['Points:1'] == y_set[idx], 'avg_yplus']= dataframe.loc[dataframe['Points:1'] == y_set[idx], 'y_plus'].mean(axis=0)
-        if 'xgb_pred' in dataframe.columns:
-            dataframe.loc[dataframe['Points:1'] == y_set[idx], 'avg_uplus_xgb']= dataframe.loc[dataframe['Points:1'] == y_set[idx], 'xgb_pred'].mean(axis=0)
-        if 'lasso_pred' in dataframe.columns:
-            dataframe.loc[dataframe['Points:1'] == y_set[idx], 'avg_uplus_lasso']= dataframe.loc[dataframe['Points:1'] == y_set[idx], 'lasso_pred'].mean(axis=0)
-        if 'ridge_pred' in dataframe.columns:
-            dataframe.loc[dataframe['Points:1'] == y_set[idx], 'avg_uplus_ridge']= dataframe.loc[dataframe['Points:1'] == y_set[idx], 'ridge_pred'].mean(axis=0)
+    # calculate averages for each delta (one pass per column over all y values)
+    y_groups = dataframe.groupby('Points:1')
+    averages = {'avg_uplus_orig':'u_plus', 'avg_yplus':'y_plus', 'avg_uplus_xgb':'xgb_pred',
+                'avg_uplus_lasso':'lasso_pred', 'avg_uplus_ridge':'ridge_pred'}
+    for average, column in averages.items():
+        if column in dataframe.columns:
+            dataframe[average] = y_groups[column].transform('mean')
     
     
     #plot law of the wall
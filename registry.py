@@ -0,0 +1,228 @@
+"""
+Registry of the saved models (MODELS/<file>/<file>.mdl, DATA_MODELS/subset_*,
+MODELS/*_model, continued boosters).
+Models are saved with a json sidecar (<model file>.meta.json) holding their
+metadata: source data, parameters, best validation RMSE, number of rounds and
+training time. The registry indexes the model folders by reading the sidecars
+only (for models saved without one, the results_<name>.rsl file next to the
+model), so that thousands of models can be listed and compared without
+unpickling them. Models are loaded on demand and kept in a least recently
+used cache bounded in memory.
+"""
+
+#import libraries
+import os, json, time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+import joblib
+from trial_store import to_json
+from forest import load_forest
+
+### ---------- GLOBAL VARIABLES -----------------###
+SIDECAR_SUFFIX = ".meta.json"
+# folders indexed by default (relative to the working folder)
+MODEL_FOLDERS = ["MODELS", "DATA_MODELS"]
+# memory of the models kept loaded (bytes, estimated by their file size)
+MAX_MEMORY = 2 * 1024 ** 3
+# json files of run directories that are not boosters
+STATE_FILES = ["checkpoint.json"]
+# files indexed as models: joblib models (.mdl), boosters (.json) and compiled
+# forests (.npz), the models saved without extension by complete_training.py,
+# and any file saved with a sidecar (save_model)
+MODEL_EXTENSIONS = [".mdl", ".json", ".npz"]
+MODEL_NAMES = ["initial_model", "tuned_model", "final_model"]
+TABLE_COLUMNS = ["name", "source", "best_rmse", "best_iteration", "n_rounds", "train_time", "file_size",
+                 "saved", "params", "path"]
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def best_rmse(results):
+    """
+    Return (best RMSE, its round) of the last evaluation set of evaluation
+    results (as evals_result), (None, None) without RMSE.
+    """
+    if not results:
+        return None, None
+    values = results[list(results)[-1]].get("rmse")
+    if not values:
+        return None, None
+    best = int(np.argmin(values))
+    return float(values[best]), best
+
+
+def model_metadata(model, results=None, source=None, params=None, train_time=None, **extra):
+    """
+    Return metadata of a trained model (XGBRegressor, Booster or search).
+    Parameters and evaluation results are taken from model if not given.
+    """
+    if params is None and hasattr(model, "get_xgb_params"):
+        params = model.get_xgb_params()
+    if results is None and hasattr(model, "evals_result"):
+        try:
+            results = model.evals_result()
+        except Exception:
+            results = None
+    booster = model
+    if hasattr(model, "best_estimator_"):
+        booster = model.best_estimator_
+    if hasattr(booster, "get_booster"):
+        booster = booster.get_booster()
+    rmse, iteration = best_rmse(results)
+    metadata = dict(source=source, params=params, best_rmse=rmse, best_iteration=iteration,
+                    n_rounds=booster.num_boosted_rounds() if isinstance(booster, xgb.Booster) else None,
+                    train_time=train_time)
+    metadata.update(extra)
+    return metadata
+
+
+def write_metadata(path, model, **kwargs):
+    """
+    Write sidecar of the model saved in path (see model_metadata).
+    """
+    metadata = dict(model_metadata(model, **kwargs), saved=time.time())
+    with open(sidecar_path(path) + ".tmp", "w") as sidecar:
+        sidecar.write(to_json(metadata))
+    os.replace(sidecar_path(path) + ".tmp", sidecar_path(path))
+    return metadata
+
+
+def save_model(model, path, results=None, results_path=None, **kwargs):
+    """
+    Save model (joblib) to path with its sidecar, and evaluation results to
+    results_path if given.
+    """
+    joblib.dump(model, path)
+    if results_path:
+        joblib.dump(results, results_path)
+    return write_metadata(path, model, results=results, **kwargs)
+
+
+def is_model_file(path):
+    """
+    Return True if path is a saved model (see MODEL_EXTENSIONS).
+    """
+    filename = os.path.basename(path)
+    if filename.startswith(".") or filename.endswith(SIDECAR_SUFFIX) or filename in STATE_FILES:
+        return False
+    if os.path.splitext(filename)[1] in MODEL_EXTENSIONS or filename in MODEL_NAMES:
+        return True
+    return os.path.isfile(sidecar_path(path))
+
+
+def load_model(path):
+    """
+    Return model saved in path: booster (.json), compiled forest (.npz) or
+    joblib model.
+    """
+    if path.endswith(".npz"):
+        return load_forest(path)
+    if path.endswith(".json"):
+        return xgb.Booster(model_file=path)
+    return joblib.load(path)
+
+
+def read_metadata(path):
+    """
+    Return metadata of the model saved in path: its sidecar, or for models
+    saved without one, the results_<name>.rsl saved next to it if any, and
+    the time the file was written.
+    """
+    info = dict(path=path, file_size=os.path.getsize(path))
+    if os.path.isfile(sidecar_path(path)):
+        with open(sidecar_path(path)) as sidecar:
+            info.update(json.load(sidecar))
+        return info
+    folder, filename = os.path.split(path)
+    name = os.path.splitext(filename)[0]
+    results_file = os.path.join(folder, "results_%s.rsl" %name)
+    rmse, iteration = best_rmse(joblib.load(results_file)) if os.path.isfile(results_file) else (None, None)
+    info.update(source=os.path.basename(folder), best_rmse=rmse, best_iteration=iteration,
+                saved=os.path.getmtime(path))
+    return info
+
+
+class ModelRegistry(object):
+    """
+    Index of the models saved in folders, with models loaded on demand.
+    Input:
+        - folders = folders searched (with their subfolders) for models
+        - max_memory = memory of the loaded models (bytes, least recently
+          used are dropped first)
+    Models are named by their path from the parent of their folder (e.g.
+    MODELS/<file>/<file>.mdl).
+    """
+    def __init__(self, folders=MODEL_FOLDERS, max_memory=MAX_MEMORY):
+        self.folders = [folders] if isinstance(folders, str) else list(folders)
+        self.max_memory = max_memory
+        self.entries = OrderedDict()
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.scan()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def scan(self):
+        """
+        Index the models of the folders (sidecars only, no model is loaded).
+        """
+        self.entries.clear()
+        for folder in self.folders:
+            parent = os.path.dirname(os.path.abspath(folder))
+            for root, _, files in sorted(os.walk(folder)):
+                for filename in sorted(files):
+                    path = os.path.join(root, filename)
+                    if not is_model_file(path):
+                        continue
+                    # with extension: a.mdl and a.json are two models
+                    name = os.path.relpath(os.path.abspath(path), parent)
+                    self.entries[name] = read_metadata(path)
+        return self
+
+    def table(self):
+        """
+        Return dataframe of the metadata of the models, best RMSE first.
+        """
+        table = pd.DataFrame([dict(info, name=name) for name, info in self.entries.items()], columns=TABLE_COLUMNS)
+        return table.sort_values("best_rmse", na_position="last").reset_index(drop=True)
+
+    def best(self, n=1):
+        """
+        Return names of the n models of best RMSE.
+        """
+        return list(self.table().name[:n])
+
+    def get(self, name):
+        """
+        Return model, from memory or loaded from its file.
+        """
+        if name in self.models:
+            self.hits += 1
+            self.models.move_to_end(name)
+            return self.models[name]
+        self.misses += 1
+        path = self.entries[name]["path"]
+        model = load_model(path)
+        self.models[name] = model
+        # keep the model just loaded even if larger than max_memory
+        while self.nbytes() > self.max_memory and len(self.models) > 1:
+            self.models.popitem(last=False)
+        return model
+
+    def nbytes(self):
+        """
+        Estimate of memory held by the loaded models (size of their files).
+        """
+        return sum(self.entries[name]["file_size"] for name in self.models)
+
+    def clear(self):
+        self.models.clear()
@@ -0,0 +1,114 @@
+"""
+Out of core training data: a directory of shards (snapshot / training csv
+files or datasets written with dataset.DatasetWriter) read batch by batch
+through the xgboost data iterator interface.
+Each batch is cleaned (features derived) when it is read, so that memory is
+bounded by the batch size rather than by the size of the training data. The
+quantized data is kept by xgboost in an external memory cache on disk.
+"""
+
+#import libraries
+import os, glob
+import numpy as np
+import xgboost as xgb
+import clean_dataframe as cd
+from dataset import is_dataset, open_dataset
+
+### ---------- GLOBAL VARIABLES -----------------###
+BATCH_SIZE = 1000000
+
+
+def list_shards(path):
+    """
+    Return shards of directory path (csv files and datasets), sorted by name.
+    A dataset directory is a single shard.
+    """
+    if is_dataset(path):
+        return [path]
+    shards = [entry for entry in sorted(glob.glob(os.path.join(path, "*")))
+              if entry.endswith(".csv") or is_dataset(entry)]
+    assert shards, "no shards found in %s" % path
+    return shards
+
+
+def is_shard_directory(path):
+    return isinstance(path, str) and os.path.isdir(path)
+
+
+def iter_dataset(path, batch_size=BATCH_SIZE):
+    """
+    Yield clean batches of a dataset: views of the memory maps if the dataset
+    holds clean data, otherwise cleaned copies of the input columns.
+    """
+    dataset = open_dataset(path)
+    clean = all(column in dataset.columns for column in cd.REQUIRED_COLUMNS)
+    columns = cd.REQUIRED_COLUMNS if clean else [column for column in cd.input_columns() if column in dataset.columns]
+    for start in range(0, len(dataset), batch_size):
+        batch = dataset.dataframe(columns, start=start, stop=start + batch_size)
+        yield batch if clean else cd.clean_dataframe(batch)
+
+
+def iter_shard(path, batch_size=BATCH_SIZE):
+    """
+    Yield clean batches of one shard.
+    """
+    if is_dataset(path):
+        return iter_dataset(path, batch_size)
+    return cd.iter_clean_dataframe(path, chunksize=batch_size)
+
+
+class ShardIterator(xgb.DataIter):
+    """
+    xgboost data iterator over the clean batches of shards.
+    Input:
+        - shards = list of shard paths
+        - part = "train" or "validation" to keep only the rows of that part
+          (random split of each batch, the same at each pass), all rows if None
+        - cache_prefix = path prefix of the external memory cache
+    """
+    def __init__(self, shards, batch_size=BATCH_SIZE, part=None, test_size=0.3, seed=0, cache_prefix=None):
+        assert part in [None, "train", "validation"], "part should be train or validation"
+        self.shards = shards
+        self.batch_size = batch_size
+        self.part = part
+        self.test_size = test_size
+        self.seed = seed
+        self.n_rows = 0
+        self._batches = None
+        super(ShardIterator, self).__init__(cache_prefix=cache_prefix)
+
+    def batches(self):
+        for shard_idx, shard in enumerate(self.shards):
+            for batch_idx, batch in enumerate(iter_shard(shard, self.batch_size)):
+                if self.part is not None:
+                    # same split of the batch at each pass over the data
+                    validation = np.random.default_rng([self.seed, shard_idx, batch_idx]).random(len(batch)) < self.test_size
+                    batch = batch[validation if self.part == "validation" else ~validation]
+                if len(batch):
+                    yield batch
+
+    def reset(self):
+        self._batches = None
+
+    def next(self, input_data):
+        if self._batches is None:
+            self._batches = self.batches()
+            self.n_rows = 0
+        batch = next(self._batches, None)
+        if batch is None:
+            return False
+        x, y = cd.X_Y_split(batch)
+        input_data(data=x, label=np.asarray(y).ravel(), feature_names=list(x.columns))
+        self.n_rows += len(batch)
+        return True
+
+
+def shard_dmatrix(iterator, max_bin=256, nthread=None, ref=None):
+    """
+    Return external memory DMatrix of a ShardIterator (quantized for the hist
+    tree method if supported by xgboost). Evaluation data should use the bins
+    of the training data (ref).
+    """
+    if hasattr(xgb, "ExtMemQuantileDMatrix"):
+        return xgb.ExtMemQuantileDMatrix(iterator, max_bin=max_bin, nthread=nthread, ref=ref)
+    return xgb.DMatrix(iterator, nthread=nthread)
@@ -0,0 +1,180 @@
+"""
+Functions for reading flow snapshots through a columnar binary cache.
+The first time a snapshot csv file is read, every column is written to its own
+raw binary file together with a small json schema. Later reads load only the
+columns that are required, without parsing the csv file again.
+"""
+
+#import libraries
+import os, re, json, hashlib, shutil
+import numpy as np
+import pandas as pd
+
+import warnings
+
+### ---------- GLOBAL VARIABLES -----------------###
+# name of folder (created next to the snapshot) where caches are stored
+CACHE_FOLDER = ".snapshot_cache"
+SCHEMA_FILE = "schema.json"
+# dtype kinds that can be stored as raw binary columns (bool, int, uint, float)
+BINARY_KINDS = "biuf"
+
+
+def snapshot_key(file_path):
+    """
+    Return key identifying the current version of a snapshot file.
+    Key is built from the absolute path, size and modification time so that
+    any change to the file invalidates its cache.
+    """
+    stat = os.stat(file_path)
+    key = "%s|%d|%d" % (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def cache_path(file_path, cache_dir=None):
+    """
+    Return location of the cache of a snapshot file.
+    By default caches are kept in a CACHE_FOLDER next to the snapshot.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_FOLDER)
+    filename = os.path.basename(file_path)
+    return os.path.join(cache_dir, "%s.%s" % (filename, snapshot_key(file_path)))
+
+
+def write_columns(path, dataframe, metadata=None):
+    """
+    Write each column of a dataframe to a raw binary file in directory path,
+    with a json schema holding column names, dtypes and optional metadata.
+    Directory is first written under a temporary name and then renamed so that
+    readers never see a partially written cache.
+    """
+    columns = []
+    temp_path = "%s.tmp-%d" % (path, os.getpid())
+    os.makedirs(temp_path, exist_ok=True)
+    for idx, column in enumerate(dataframe.columns):
+        values = np.ascontiguousarray(dataframe[column].values)
+        column_file = "col_%04d.bin" % idx
+        values.tofile(os.path.join(temp_path, column_file))
+        columns.append(dict(name=column, file=column_file, dtype=values.dtype.str))
+    schema = dict(n_rows=len(dataframe), columns=columns, metadata=metadata or {})
+    with open(os.path.join(temp_path, SCHEMA_FILE), "w") as schema_file:
+        json.dump(schema, schema_file, indent=1)
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        # cache written by another process in the meantime, keep theirs
+        shutil.rmtree(temp_path, ignore_errors=True)
+    return path
+
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE)) as schema_file:
+        return json.load(schema_file)
+
+
+def read_columns(path, columns=None, mmap=False):
+    """
+    Read columns of a directory written with write_columns into a dataframe.
+    Input:
+        - columns = list of columns to read, all columns are read if None.
+          Columns not present in the cache are ignored so that optional
+          columns (e.g. viscosity) can be requested.
+        - mmap = memory map the binary files instead of loading them.
+    """
+    schema = read_schema(path)
+    available = {column["name"]: column for column in schema["columns"]}
+    if columns is None:
+        columns = list(available)
+    data = {}
+    for name in columns:
+        if name not in available:
+            continue
+        column = available[name]
+        column_path = os.path.join(path, column["file"])
+        dtype = np.dtype(column["dtype"])
+        if mmap:
+            if schema["n_rows"]:
+                data[name] = np.memmap(column_path, dtype=dtype, mode="r", shape=(schema["n_rows"],))
+            else:
+                data[name] = np.empty(0, dtype=dtype)
+        else:
+            data[name] = np.fromfile(column_path, dtype=dtype)
+    return pd.DataFrame(data, columns=list(data), copy=False)
+
+
+def clear_stale_caches(file_path, cache_dir=None):
+    """
+    Remove caches of older versions of a snapshot file.
+    """
+    current = cache_path(file_path, cache_dir)
+    folder = os.path.dirname(current)
+    pattern = re.compile(re.escape(os.path.basename(file_path)) + r"\.[0-9a-f]{16}$")
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if pattern.match(name) and path != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def read_snapshot(file_path, columns=None, cache_dir=None, use_cache=True, mmap=False):
+    """
+    Read snapshot csv file into dataframe, using the columnar cache if present.
+    On the first read the csv file is parsed and the cache is written, later
+    reads only load the columns required.
+    Input:
+        - file_path = path to snapshot csv file
+        - columns = list of columns to return, all columns if None. Columns
+          not present in the snapshot are ignored.
+        - cache_dir = folder to store caches in, default is next to snapshot
+        - use_cache = set to False to always parse the csv file
+        - mmap = memory map the cached columns instead of loading them
+    """
+    if not use_cache:
+        dataframe = pd.read_csv(file_path)
+        return select_columns(dataframe, columns)
+    path = cache_path(file_path, cache_dir)
+    if os.path.isdir(path):
+        return read_columns(path, columns=columns, mmap=mmap)
+
+    dataframe = pd.read_csv(file_path)
+    if all(dtype.kind in BINARY_KINDS for dtype in dataframe.dtypes):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            clear_stale_caches(file_path, cache_dir)
+            write_columns(path, dataframe, metadata=dict(source=os.path.abspath(file_path)))
+        except OSError as exc:
+            warnings.warn("Unable to write snapshot cache for %s: %s" % (file_path, exc))
+    else:
+        warnings.warn("Snapshot %s has non numeric columns, cache not written." % file_path)
+    return select_columns(dataframe, columns)
+
+
+def iter_snapshot(file_path, chunksize=1000000, columns=None, cache_dir=None):
+    """
+    Read snapshot in chunks of chunksize rows, so that snapshots larger than
+    memory can be processed. Chunks are sliced from the cache if it exists,
+    otherwise the csv file is parsed chunk by chunk (no cache is written).
+    Chunks keep the row index of the full snapshot.
+    """
+    path = cache_path(file_path, cache_dir)
+    if os.path.isdir(path):
+        mapped = read_columns(path, columns=columns, mmap=True)
+        for start in range(0, len(mapped), chunksize):
+            stop = min(start + chunksize, len(mapped))
+            data = {column: np.array(mapped[column].values[start:stop]) for column in mapped.columns}
+            yield pd.DataFrame(data, columns=list(mapped.columns), index=pd.RangeIndex(start, stop))
+        return
+    if columns is None:
+        usecols = None
+    else:
+        usecols = lambda column: column in columns
+    for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=usecols):
+        yield select_columns(chunk, columns)
+
+
+def select_columns(dataframe, columns):
+    if columns is None:
+        return dataframe
+    return dataframe[[column for column in columns if column in dataframe.columns]]
@@ -2,21 +2,30 @@
     # run through all the dataset (snapshots of the flow)
     # build a model and train it
     # save model
+# usage: python submodel.py <source folder> [workers] [threads] [mode]
+    # workers: number of files processed at the same time (default 1)
+    # threads: total number of threads shared by the workers (default all cores)
+    # mode: "separate" to train one model per file (default), "continue" to
+    # train one model over all files in order, adding rounds with each file
+    # (files are processed one at a time with all threads)
 
 # import libraries
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import xgboost as xgb
-import joblib, glob
-from clean_dataframe import X_Y_split, clean_dataframe
+import joblib, glob, json
+from clean_dataframe import X_Y_split, clean_dataframe, input_columns
+from snapshot_cache import read_snapshot
 from sklearn.model_selection import KFold, GridSearchCV, RandomizedSearchCV
 from sklearn.model_selection import train_test_split
 from functions import XGBoost_Model
+from registry import save_model, write_metadata
 
 import sys, os, shutil
 from datetime import datetime
-import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import time, traceback
 
 default_params = dict(max_depth=7,
                       colsample_bytree=0.9,
@@ -35,65 +44,194 @@ default_params = dict(max_depth=7,
 WORKING_FOLDER = os.getcwd()
 SOURCE_FILES = ""
 MODELS = WORKING_FOLDER +"/MODELS"
+CONTINUED_MODEL = MODELS + "/continued"
+# boosting rounds added with each file in continued training
+ROUNDS_PER_FILE = 10
 
-if not os.path.isdir(MODELS):
-    os.mkdir(MODELS)
-    print("directory for models created")
 
-# get path to files
-try:
-    path = sys.argv[1]
-except:
-    print("Specify source location!")
-    sys.exit(1)
-
-files = glob.glob(path +"/*.csv")
-num_files = len(files)
-print("Number of files found: %d" %num_files)
+def prepare_file(file):
+    """
+    Read and clean one snapshot, returning the sample used for training.
+    """
+    dataframe = read_snapshot(file, columns=input_columns())
+    print("Cleaning Dataframe and keeping only required columns...\n")
+    clean_data = clean_dataframe(dataframe)
+    # for test
+    return clean_data.sample(frac=0.01)
 
-file_count = 0
 
-# iterate through all files
-for file in files:
+def train_file(file, nthread=None):
+    """
+    Read and clean one snapshot, train a model on it and save model and
+    evaluation results in MODELS/<filename>.
+    nthread: number of threads used by xgboost (all cores if None)
+    """
     filename = os.path.split(file)[1]
     # set up save space for file
     save_path = MODELS +"/%s" %filename
     if not os.path.isdir(save_path):
         os.mkdir(save_path)
-    #get start time
-    file_start_time = datetime.now()
-    print("===========================================================")
-    print("Total Files\t:\t %d "%num_files)
-    print("Completed\t:\t %d" %file_count)
-    print("Remaining\t:\t %d" %(num_files - file_count))
-    print("===========================================================\n")
-    print("Current file\t: \t%s" %filename)
-    print("start time\t: \t%s\n" %file_start_time.strftime("%D - %H:%M:%S"))
-    print("Creating DataFrame object...\n")
-    dataframe = pd.read_csv(file)
-
-    print("Cleaning Dataframe and keeping only required columns...\n")
-    clean_data = clean_dataframe(dataframe)
-    # for test
-    clean_data = clean_data.sample(frac=0.01)
+    print("Creating DataFrame object for %s...\n" %filename)
+    clean_data = prepare_file(file)
     # create xgboost model
-    model_test = XGBoost_Model(default_params, clean_data)
+    params = dict(default_params)
+    if nthread:
+        params["n_jobs"] = nthread
+    model_test = XGBoost_Model(params, clean_data)
 
     # train_model
     train_start_time = datetime.now()
-    print("->Starting Model Training at %s...\n" %train_start_time.strftime("%D - %H:%M:%S"))
+    print("->Starting Model Training for %s at %s...\n" %(filename, train_start_time.strftime("%D - %H:%M:%S")))
     fitted_model = model_test.fit(n_estimators=10, save_plot=True, save_path=save_path)
+    plt.close("all")
     results = fitted_model.evals_result_
 
     train_end_time = datetime.now()
-    print("\n->Completed Model Training at %s...\n" %train_end_time.strftime("%D - %H:%M:%S"))
+    print("\n->Completed Model Training for %s at %s...\n" %(filename, train_end_time.strftime("%D - %H:%M:%S")))
     print("Total time for training : %d" %(train_end_time - train_start_time).total_seconds())
 
     #save model and results
     print("\nSaving Model and evaluation results for %s\n" %filename)
-    joblib.dump(fitted_model, save_path+"/%s.mdl"%filename)
-    joblib.dump(results, save_path+"/results_%s.rsl"%filename)
+    save_model(fitted_model, save_path+"/%s.mdl"%filename, results=results,
+               results_path=save_path+"/results_%s.rsl"%filename, source=file,
+               train_time=(train_end_time - train_start_time).total_seconds())
 
 
-    #increment file count
-    file_count += 1
+def run_file(file, nthread=None):
+    """
+    Train model of one file, catching errors so that remaining files are still
+    processed. Returns (filename, status, wall time in seconds, error).
+    """
+    filename = os.path.split(file)[1]
+    start_time = time.time()
+    try:
+        train_file(file, nthread=nthread)
+    except Exception:
+        return filename, "failed", time.time() - start_time, traceback.format_exc()
+    return filename, "completed", time.time() - start_time, None
+
+
+def continue_training(files, nthread=None, rounds=ROUNDS_PER_FILE, save_path=CONTINUED_MODEL):
+    """
+    Train one model over all files: trees of the booster trained up to a file
+    are kept and rounds are added with the data of the next file.
+    The booster is saved in save_path after each file (model.json) together
+    with a checkpoint of the files done, so that a restarted training skips
+    them and continues from the saved booster.
+    Yields outcome of each file (as run_file).
+    """
+    model_file = save_path + "/model.json"
+    checkpoint_file = save_path + "/checkpoint.json"
+    if not os.path.isdir(save_path):
+        os.mkdir(save_path)
+    checkpoint = dict(files=[], rounds=[])
+    booster = None
+    if os.path.isfile(checkpoint_file):
+        with open(checkpoint_file) as saved:
+            checkpoint = json.load(saved)
+        booster = xgb.Booster(model_file=model_file)
+        # the model is written before the checkpoint: drop rounds of a file
+        # the checkpoint does not list (interrupted between both writes)
+        if booster.num_boosted_rounds() > checkpoint["rounds"][-1]:
+            booster = booster[:checkpoint["rounds"][-1]]
+        print("Continuing from checkpoint: %d files, %d rounds\n" %(len(checkpoint["files"]), booster.num_boosted_rounds()))
+
+    params = dict(default_params)
+    for file in files:
+        filename = os.path.split(file)[1]
+        if filename in checkpoint["files"]:
+            print("%s already in model, skipping" %filename)
+            continue
+        start_time = time.time()
+        try:
+            print("Creating DataFrame object for %s...\n" %filename)
+            model = XGBoost_Model(dict(params), prepare_file(file), nthread=nthread)
+            model.train_model(num_rounds=rounds, xgb_model=booster)
+        except Exception:
+            yield filename, "failed", time.time() - start_time, traceback.format_exc()
+            continue
+        booster = model.model
+        # write model before checkpoint, so that the checkpoint never lists a
+        # file missing from the saved model
+        booster.save_model(model_file + ".tmp.json")
+        os.replace(model_file + ".tmp.json", model_file)
+        joblib.dump(model.evals_result, save_path + "/results_%s.rsl" %filename)
+        write_metadata(model_file, booster, results=model.evals_result, source=checkpoint["files"] + [filename],
+                       params=params, train_time=time.time() - start_time)
+        checkpoint["files"].append(filename)
+        checkpoint["rounds"].append(booster.num_boosted_rounds())
+        with open(checkpoint_file + ".tmp", "w") as saved:
+            json.dump(checkpoint, saved, indent=1)
+        os.replace(checkpoint_file + ".tmp", checkpoint_file)
+        yield filename, "completed", time.time() - start_time, None
+
+
+def split_threads(threads, workers):
+    """
+    Return number of threads for xgboost in each of the workers so that the
+    total does not exceed threads.
+    """
+    return max(1, threads // workers)
+
+
+if __name__ == "__main__":
+    if not os.path.isdir(MODELS):
+        os.mkdir(MODELS)
+        print("directory for models created")
+
+    # get path to files
+    try:
+        path = sys.argv[1]
+    except:
+        print("Specify source location!")
+        sys.exit(1)
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    mode = sys.argv[4] if len(sys.argv) > 4 else "separate"
+    assert mode in ["separate", "continue"], "mode should be separate or continue"
+
+    # snapshots in time order
+    files = sorted(glob.glob(path +"/*.csv"))
+    num_files = len(files)
+    print("Number of files found: %d" %num_files)
+    workers = max(1, min(workers, num_files))
+    if mode == "continue":
+        # each file continues the model of the previous one
+        workers = 1
+    nthread = split_threads(threads, workers)
+    print("Workers\t\t:\t %d" %workers)
+    print("Threads/worker\t:\t %d\n" %nthread)
+
+    start_time = datetime.now()
+    print("start time\t: \t%s\n" %start_time.strftime("%D - %H:%M:%S"))
+
+    summary = []
+    # iterate through all files
+    if mode == "continue":
+        outcomes = continue_training(files, nthread=nthread)
+    elif workers == 1:
+        outcomes = (run_file(file, nthread) for file in files)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        futures = [pool.submit(run_file, file, nthread) for file in files]
+        outcomes = (future.result() for future in as_completed(futures))
+    for filename, status, wall_time, error in outcomes:
+        summary.append(dict(file=filename, status=status, wall_time=wall_time))
+        print("===========================================================")
+        print("%s\t:\t %s in %.1f s" %(filename, status, wall_time))
+        if error:
+            print(error)
+        print("Total Files\t:\t %d "%num_files)
+        print("Completed\t:\t %d" %len(summary))
+        print("Remaining\t:\t %d" %(num_files - len(summary)))
+        print("===========================================================\n")
+    if workers > 1:
+        pool.shutdown()
+
+    # summary of all files
+    summary = pd.DataFrame(summary, columns=["file", "status", "wall_time"])
+    summary.to_csv(MODELS + "/training_summary.csv", header=True, index=False)
+    print("SUMMARY:\n")
+    print(summary.to_string(index=False))
+    print("\nFailed files\t:\t %d" %(summary.status == "failed").sum())
+    print("Total time\t:\t %d s" %(datetime.now() - start_time).total_seconds())
@@ -0,0 +1,101 @@
+"""
+Persistent store of tuning trials (sqlite file).
+Each evaluated candidate is written as soon as it finishes, with its
+parameters, fold scores and timing, identified by the hash of the tuning
+dataset and the settings of the evaluation (folds, rounds, ...). Searches
+using a store read candidates already evaluated instead of training them
+again, so an interrupted search resumes where it stopped.
+"""
+
+#import libraries
+import json, sqlite3, time
+from contextlib import closing
+import numpy as np
+import pandas as pd
+
+### ---------- GLOBAL VARIABLES -----------------###
+TRIALS_FILE = "tuning_trials.sqlite"
+# seconds to wait for another process writing to the store
+TIMEOUT = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    setting TEXT NOT NULL,
+    params TEXT NOT NULL,
+    n_rounds INTEGER,
+    fold_scores TEXT NOT NULL,
+    mean_score REAL,
+    std_score REAL,
+    fit_time REAL,
+    finished REAL,
+    UNIQUE (dataset, setting, params)
+)
+"""
+
+
+def to_json(value):
+    """
+    Return json text of value, keys sorted so that equal parameters give the
+    same text (numpy values converted).
+    """
+    return json.dumps(value, sort_keys=True, default=lambda item: item.item())
+
+
+class TrialStore(object):
+    """
+    Store of trials in the sqlite file path. A connection is opened for each
+    operation, so the store can be passed to worker processes.
+    """
+    def __init__(self, path=TRIALS_FILE):
+        self.path = path
+        with self.connect() as connection, connection:
+            connection.execute(SCHEMA)
+
+    def __repr__(self):
+        return "TrialStore(%s)" % self.path
+
+    def connect(self):
+        """
+        Return connection closed at the end of a with block, in which the
+        statements are committed.
+        """
+        return closing(sqlite3.connect(self.path, timeout=TIMEOUT))
+
+    def get(self, dataset, setting, params):
+        """
+        Return (fold scores, number of rounds) of a trial, None if not
+        evaluated.
+        """
+        with self.connect() as connection, connection:
+            row = connection.execute("SELECT fold_scores, n_rounds FROM trials WHERE dataset=? AND setting=? AND params=?",
+                                     (dataset, to_json(setting), to_json(params))).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def add(self, dataset, setting, params, fold_scores, n_rounds=None, fit_time=None):
+        """
+        Write trial (committed at once).
+        """
+        fold_scores = [float(score) for score in fold_scores]
+        with self.connect() as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO trials (dataset, setting, params, n_rounds, fold_scores, "
+                               "mean_score, std_score, fit_time, finished) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (dataset, to_json(setting), to_json(params), n_rounds, to_json(fold_scores),
+                                float(np.mean(fold_scores)), float(np.std(fold_scores)),
+                                fit_time, time.time()))
+
+    def trials(self, dataset=None):
+        """
+        Return dataframe of the trials (of dataset if given), best first.
+        """
+        query = "SELECT * FROM trials"
+        args = ()
+        if dataset is not None:
+            query += " WHERE dataset=?"
+            args = (dataset,)
+        with self.connect() as connection, connection:
+            trials = pd.read_sql_query(query + " ORDER BY mean_score DESC", connection, params=args)
+        return trials
@@ -0,0 +1,312 @@
+"""
+Tuning of xgboost parameters with the native xgboost api.
+Successive halving: all candidates are first trained with few boosting rounds
+on a small fraction of the data. At each rung only the best 1/eta of the
+candidates are kept, and the rounds and the data fraction are multiplied by
+eta, up to the full budget for the last rung. Candidates are ranked with the
+validation RMSE reported by xgboost on each fold.
+Cross validation (CVFolds): the fold DMatrix objects of a dataset are built
+once and used for every candidate, with early stopping per candidate. The
+fold of each row is saved, so that runs on the same dataset use the same
+folds.
+Results have the shape of the results of sklearn searches (best_params_,
+best_score_, cv_results_), with scores as negative mean squared errors.
+Searches given a TrialStore (see trial_store.py) write each evaluation as it
+finishes and skip evaluations already in the store.
+"""
+
+#import libraries
+import os, time
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.model_selection import KFold, ParameterSampler, ParameterGrid
+from clean_dataframe import X_Y_split
+from dmatrix_cache import content_hash
+
+### ---------- GLOBAL VARIABLES -----------------###
+# XGBRegressor parameters not used by xgb.train
+SKLEARN_PARAMS = ["n_estimators", "silent", "missing", "importance_type"]
+# smallest number of rows of a fold
+MIN_FOLD_ROWS = 100
+# folder of the saved fold assignments
+FOLDS_FOLDER = ".folds"
+
+
+def booster_params(params):
+    """
+    Return parameters of XGBRegressor (params) for the xgb.train function.
+    """
+    params = {key: value for key, value in params.items()
+              if key not in SKLEARN_PARAMS and value is not None}
+    if "n_jobs" in params:
+        params["nthread"] = params.pop("n_jobs")
+    if "random_state" in params:
+        params["seed"] = params.pop("random_state")
+    # numpy values from the search space
+    return {key: value.item() if hasattr(value, "item") else value for key, value in params.items()}
+
+
+class SearchResults(object):
+    """
+    Results of a search, as the attributes of a fitted sklearn search.
+    cv_results_ holds one entry per candidate, with the scores of the last
+    rung it was evaluated in. history_ holds every evaluation.
+    """
+    def __init__(self, cv_results, history):
+        self.cv_results_ = cv_results
+        self.history_ = history
+        best = int(np.argmin(cv_results["rank_test_score"]))
+        self.best_index_ = best
+        self.best_params_ = cv_results["params"][best]
+        self.best_score_ = cv_results["mean_test_score"][best]
+
+    def __repr__(self):
+        return "SearchResults(best_score_=%f, best_params_=%s)" % (self.best_score_, self.best_params_)
+
+
+def rung_budgets(n_rungs, max_rounds, eta, min_rounds=1, min_fraction=0.0):
+    """
+    Return (rounds, data fraction) of each rung, the last rung using the full
+    budget.
+    """
+    budgets = []
+    for rung in range(n_rungs):
+        scale = float(eta) ** (rung - n_rungs + 1)
+        budgets.append((max(min_rounds, int(round(max_rounds * scale))), max(min_fraction, scale)))
+    return budgets
+
+
+def fold_matrices(x, y, n_splits, random_state=0):
+    """
+    Return list of (train, validation) DMatrix of each fold of x, y.
+    """
+    kfold = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    folds = []
+    for train_rows, validation_rows in kfold.split(x):
+        folds.append((xgb.DMatrix(x.iloc[train_rows], label=y[train_rows], feature_names=list(x.columns)),
+                      xgb.DMatrix(x.iloc[validation_rows], label=y[validation_rows], feature_names=list(x.columns))))
+    return folds
+
+
+def stored_evaluation(store, dataset, setting, params, evaluate):
+    """
+    Return (fold scores, rounds) of params from store, or evaluated with
+    evaluate() and written to store (no store if None).
+    """
+    # threads do not change the results
+    key = {name: value for name, value in params.items() if name != "nthread"}
+    if store is not None:
+        stored = store.get(dataset, setting, key)
+        if stored is not None:
+            return stored
+    start_time = time.time()
+    scores, rounds = evaluate()
+    if store is not None:
+        store.add(dataset, setting, key, scores, n_rounds=rounds, fit_time=time.time() - start_time)
+    return scores, rounds
+
+
+def evaluate_candidate(params, folds, num_rounds):
+    """
+    Train candidate on each fold and return the fold scores (negative squared
+    validation RMSE reported by xgboost after num_rounds rounds).
+    """
+    scores = []
+    for dtrain, dvalidation in folds:
+        evals_result = {}
+        xgb.train(dict(params, eval_metric="rmse"), dtrain, num_boost_round=num_rounds, evals=[(dvalidation, "validation")],
+                  evals_result=evals_result, verbose_eval=False)
+        scores.append(-evals_result["validation"]["rmse"][-1] ** 2)
+    return scores
+
+
+def successive_halving(data, param_distributions, base_params=None, n_candidates=10, n_splits=5, eta=3,
+                       max_rounds=None, min_rounds=1, random_state=0, verbose=True, store=None):
+    """
+    Tune parameters by successive halving over boosting rounds and data
+    fraction.
+    Input:
+        - data = clean dataset used for tuning, usually the training dataset
+        - param_distributions = parameter search space (as RandomizedSearchCV)
+        - base_params = parameters of the model (XGBRegressor or xgb.train)
+        - n_candidates = number of candidates drawn from the search space
+        - eta = fraction of candidates dropped at each rung (1 - 1/eta) and
+          factor of the rounds and data fraction between rungs
+        - max_rounds = rounds of the last rung, n_estimators of base_params
+          (or of the candidate) if None
+        - store = TrialStore of the evaluations
+    Returns SearchResults.
+    """
+    base_params = dict(base_params or {})
+    if max_rounds is None:
+        max_rounds = base_params.get("n_estimators") or 100
+    candidates = list(ParameterSampler(param_distributions, n_candidates, random_state=random_state))
+    n_rungs = 1 + int(np.floor(np.log(len(candidates)) / np.log(eta) + 1e-9))
+    x, y = X_Y_split(data)
+    y = np.asarray(y).ravel()
+    dataset = content_hash(x, y)
+    # nested subsets: the data of a rung contains the data of previous rungs
+    order = np.random.RandomState(random_state).permutation(len(x))
+    min_fraction = min(1.0, float(MIN_FOLD_ROWS * n_splits) / len(x))
+
+    history = []
+    last_scores = {}
+    alive = list(range(len(candidates)))
+    for rung, (rounds, fraction) in enumerate(rung_budgets(n_rungs, max_rounds, eta, min_rounds, min_fraction)):
+        rows = np.sort(order[:int(np.ceil(fraction * len(x)))])
+        folds = fold_matrices(x.iloc[rows], y[rows], n_splits, random_state=random_state)
+        if verbose:
+            print("rung %d\t:\t%d candidates, %d rows, %s rounds" %(rung, len(alive), len(rows), rounds))
+        for idx in alive:
+            candidate = candidates[idx]
+            # candidates tuning n_estimators use their own budget
+            candidate_rounds = rounds
+            if "n_estimators" in candidate:
+                candidate_rounds = max(min_rounds, int(round(candidate["n_estimators"] * rounds / float(max_rounds))))
+            params = booster_params(dict(base_params, **candidate))
+            setting = dict(method="halving", rows=len(rows), n_splits=n_splits, random_state=random_state,
+                           n_rounds=candidate_rounds)
+            scores, _ = stored_evaluation(store, dataset, setting, params,
+                                          lambda: (evaluate_candidate(params, folds, candidate_rounds), candidate_rounds))
+            last_scores[idx] = (rung, candidate_rounds, fraction, scores)
+            history.append(dict(candidate=idx, iter=rung, n_rounds=candidate_rounds, data_fraction=fraction,
+                                mean_test_score=np.mean(scores), std_test_score=np.std(scores), params=candidate))
+        # keep best candidates for next rung
+        alive = sorted(alive, key=lambda idx: -np.mean(last_scores[idx][3]))
+        alive = alive[:max(1, int(np.ceil(len(alive) / float(eta))))]
+
+    return SearchResults(search_cv_results(candidates, last_scores, n_splits), pd.DataFrame(history))
+
+
+def search_cv_results(candidates, last_scores, n_splits):
+    """
+    Return cv_results_ dict of candidates from the (rung, rounds, data
+    fraction, fold scores) of the last evaluation of each candidate.
+    Candidates evaluated in later rungs are ranked before candidates dropped
+    earlier.
+    """
+    rungs = np.array([last_scores[idx][0] for idx in range(len(candidates))])
+    means = np.array([np.mean(last_scores[idx][3]) for idx in range(len(candidates))])
+    ranking = np.lexsort((-means, -rungs))
+    ranks = np.empty(len(candidates), dtype=int)
+    ranks[ranking] = np.arange(1, len(candidates) + 1)
+    cv_results = dict(params=candidates,
+                      mean_test_score=means,
+                      std_test_score=np.array([np.std(last_scores[idx][3]) for idx in range(len(candidates))]),
+                      rank_test_score=ranks,
+                      iter=rungs,
+                      n_rounds=np.array([last_scores[idx][1] for idx in range(len(candidates))]),
+                      data_fraction=np.array([last_scores[idx][2] for idx in range(len(candidates))]))
+    for split in range(n_splits):
+        cv_results["split%d_test_score" % split] = np.array([last_scores[idx][3][split] for idx in range(len(candidates))])
+    for name in sorted(set(name for candidate in candidates for name in candidate)):
+        cv_results["param_%s" % name] = np.array([candidate.get(name) for candidate in candidates], dtype=object)
+    return cv_results
+
+
+class CVFolds(object):
+    """
+    Cross validation folds of a dataset for the xgboost api.
+    The DMatrix of the training and validation rows of each fold are built
+    once and used by every call of cv.
+    Input:
+        - data = clean dataset used for tuning
+        - n_splits = number of folds
+        - assignment = fold of each row. If None, read from folds_dir when
+          saved for the same dataset (content hash) and n_splits, otherwise
+          drawn with seed and saved
+    """
+    def __init__(self, data, n_splits=5, seed=0, assignment=None, folds_dir=FOLDS_FOLDER):
+        x, y = X_Y_split(data)
+        y = np.asarray(y).ravel()
+        self.data = data
+        self.n_splits = n_splits
+        self.key = content_hash(x, y)
+        if assignment is None:
+            assignment = self.load_assignment(folds_dir, seed)
+        assert len(assignment) == len(data), "fold assignment does not match dataset"
+        self.assignment = assignment
+        self.assignment_key = content_hash(assignment)
+        self.folds = []
+        for fold in range(n_splits):
+            train_rows = np.nonzero(assignment != fold)[0]
+            validation_rows = np.nonzero(assignment == fold)[0]
+            self.folds.append((xgb.DMatrix(x.iloc[train_rows], label=y[train_rows], feature_names=list(x.columns)),
+                               xgb.DMatrix(x.iloc[validation_rows], label=y[validation_rows], feature_names=list(x.columns))))
+
+    def __len__(self):
+        return self.n_splits
+
+    def load_assignment(self, folds_dir, seed):
+        path = os.path.join(folds_dir, "%s_%d.npy" % (self.key, self.n_splits))
+        if os.path.isfile(path):
+            return np.load(path)
+        # balanced folds in random order
+        assignment = np.random.RandomState(seed).permutation(len(self.data)) % self.n_splits
+        os.makedirs(folds_dir, exist_ok=True)
+        np.save(path, assignment)
+        return assignment
+
+    def cv(self, params, num_boost_round, early_stopping_rounds=None):
+        """
+        Train params on all folds together (as xgb.cv) and return the
+        validation RMSE of each fold and round (rounds x folds), stopped when
+        the mean over the folds did not improve for early_stopping_rounds
+        rounds and truncated at the best round.
+        """
+        params = dict(params, eval_metric="rmse")
+        boosters = [xgb.Booster(params, [dtrain, dvalidation]) for dtrain, dvalidation in self.folds]
+        history = []
+        best_round = 0
+        for iteration in range(num_boost_round):
+            scores = []
+            for booster, (dtrain, dvalidation) in zip(boosters, self.folds):
+                booster.update(dtrain, iteration)
+                scores.append(float(booster.eval(dvalidation).split(":")[-1]))
+            history.append(scores)
+            if np.mean(scores) < np.mean(history[best_round]):
+                best_round = iteration
+            if early_stopping_rounds and iteration - best_round >= early_stopping_rounds:
+                break
+        return np.array(history[:best_round + 1])
+
+
+def cv_search(folds, param_distributions, base_params=None, n_candidates=None, early_stopping_rounds=10,
+              max_rounds=None, random_state=0, verbose=True, store=None):
+    """
+    Evaluate candidates of a search space with the cross validation folds of
+    CVFolds (folds), each candidate stopped early on its own.
+    Input:
+        - n_candidates = number of candidates drawn from the search space, all
+          combinations (as GridSearchCV) if None
+        - max_rounds = maximum number of rounds, n_estimators of base_params
+          (or of the candidate) if None
+        - store = TrialStore of the evaluations
+    Returns SearchResults, with the number of rounds of each candidate.
+    """
+    base_params = dict(base_params or {})
+    if max_rounds is None:
+        max_rounds = base_params.get("n_estimators") or 100
+    if n_candidates is None:
+        candidates = list(ParameterGrid(param_distributions))
+    else:
+        candidates = list(ParameterSampler(param_distributions, n_candidates, random_state=random_state))
+    last_scores = {}
+    history = []
+    for idx, candidate in enumerate(candidates):
+        rounds = int(candidate.get("n_estimators", max_rounds))
+        params = booster_params(dict(base_params, **candidate))
+        setting = dict(method="cv", folds=folds.assignment_key, n_rounds=rounds,
+                       early_stopping_rounds=early_stopping_rounds)
+
+        def evaluate():
+            fold_rmse = folds.cv(params, rounds, early_stopping_rounds)
+            return list(-fold_rmse[-1] ** 2), len(fold_rmse)
+        scores, n_rounds = stored_evaluation(store, folds.key, setting, params, evaluate)
+        last_scores[idx] = (0, n_rounds, 1.0, scores)
+        history.append(dict(candidate=idx, n_rounds=n_rounds, mean_test_score=np.mean(scores),
+                            std_test_score=np.std(scores), params=candidate))
+        if verbose:
+            print("%s\t:\tRMSE %f in %d rounds" %(candidate, np.sqrt(-np.mean(scores)), n_rounds))
+    return SearchResults(search_cv_results(candidates, last_scores, len(folds)), pd.DataFrame(history))
@@ -1,38 +1,23 @@
+# script to compute the learning curve of the model: train on nested subsets
+# of the training data and compare the validation RMSE of each size
+# usage: python vary_data.py <training data> [workers] [cores] [tolerance]
+    # workers: number of subset sizes trained at the same time (default 1)
+    # cores: total number of cores shared by the workers (default all cores)
+    # tolerance: relative RMSE above the best RMSE accepted when choosing the
+    # smallest fraction (default 0.01)
 
 #import libraries
 
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import xgboost as xgb
-import joblib, time
-from clean_dataframe import X_Y_split, clean_dataframe
-from sklearn.model_selection import KFold, GridSearchCV, RandomizedSearchCV
-from sklearn.model_selection import train_test_split
-from functions import XGBoost_Model
-from datetime import datetime
+import time
+from clean_dataframe import clean_dataframe, input_columns
+from dataset import read_training_data
+from learning_curve import learning_curve, smallest_fraction, plot_learning_curve
 
 import sys, os, shutil
 
-try:
-    if len(sys.argv) > 1:
-        data_file = sys.argv[1]
-except FileNotFoundError:
-    print("Unable to get main file for training, check path!")
-    sys.exit(1)
-
-# some house cleaning before starting
-
-WORKING_FOLDER = os.getcwd()
-MODELS = WORKING_FOLDER + "/DATA_MODELS"
-SUPERCEDED_PATH = WORKING_FOLDER +"/SUPERCEDED"
-
-if not os.path.isdir(MODELS):
-    os.mkdir(MODELS)
-#raw_file = pd.read_csv("./Experiments/exp_1/test_data/test_1/test_1.csv")
-raw_file = pd.read_csv(data_file)
-clean_data = clean_dataframe(raw_file)
-
 # default parameters
 default_params = dict(max_depth=7,
                       colsample_bytree=0.9,
@@ -49,33 +34,40 @@ default_params = dict(max_depth=7,
 # data ranges
 ranges = [0.01, 0.05, 0.1]
 
-for subset in ranges:
-    subset_name = "subset_%s"%subset
-    # create directory for details of subset
-    subset_path = MODELS + "/%s"%subset_name
-    if not os.path.isdir(subset_path):
-        os.mkdir(subset_path)
-    #create subset by sampling main data
-    subset_data = clean_data.sample(frac=subset)
+if __name__ == "__main__":
+    try:
+        data_file = sys.argv[1]
+    except IndexError:
+        print("Unable to get main file for training, check path!")
+        sys.exit(1)
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    cores = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+    tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else 0.01
+
+    # some house cleaning before starting
+
+    WORKING_FOLDER = os.getcwd()
+    MODELS = WORKING_FOLDER + "/DATA_MODELS"
+    SUPERCEDED_PATH = WORKING_FOLDER +"/SUPERCEDED"
+
+    if not os.path.isdir(MODELS):
+        os.mkdir(MODELS)
+    #raw_file = pd.read_csv("./Experiments/exp_1/test_data/test_1/test_1.csv")
+    raw_file = read_training_data(data_file, columns=input_columns())
+    clean_data = clean_dataframe(raw_file)
 
-    # confirm shape of subset dataset
+    # confirm shape of dataset
     print("Shape of data being used for training is :")
-    print(subset_data.shape)
-    #create xgboost model object
-    model_test = XGBoost_Model(default_params, subset_data )
+    print(clean_data.shape)
 
-    #train model
     start_time = time.time()
-    print("Training Model for %s\n" %subset_name)
-    fitted_model = model_test.fit(n_estimators=20, save_plot=True,
-                                  save_path=subset_path)
-    results = fitted_model.evals_result_
-    #save model and results
-    print("\nSaving Model and evaluation results for %s\n" %subset_name)
-    joblib.dump(fitted_model, subset_path+"/%s.mdl"%subset_name)
-    joblib.dump(results, subset_path+"/results_%s.rsl"%subset_name)
-    print("Completed in %d" %(time.time() - start_time))
+    table = learning_curve(clean_data, ranges, default_params, workers=workers, cores=cores,
+                           n_estimators=20, save_path=MODELS)
     print("\n===================================================\n")
+    print(table.to_string(index=False))
+    table.to_csv(MODELS + "/learning_curve.csv", header=True, index=False)
+    plot_learning_curve(table, save=True, save_path=MODELS)
+    print("\nSmallest fraction within %.1f%% of best RMSE\t:\t%s" %(100 * tolerance, smallest_fraction(table, tolerance)))
+    print("Completed in %d" %(time.time() - start_time))
 
-
-print("TRAINING COMPLETED")
+    print("TRAINING COMPLETED")